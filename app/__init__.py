@@ -2,7 +2,11 @@ import os
 from flask import Flask
 from dotenv import load_dotenv
 from config import config
+from .commands import register_commands
+from . import cache, categories, counters  # noqa: F401 (регистрирует обработчики счетчиков и версий кэшей)
+from .attachments import UploadRequest, close_request_uploads
 from .extensions import csrf, db
+from .workers import BACKGROUND_WORKERS, init_workers
 from .template_utils import register_template_utils
 
 # Импорт Blueprints
@@ -19,6 +23,10 @@ def create_app(config_name='default'):
 
     # Создаем экземпляр приложения Flask
     app = Flask(__name__)
+
+    # Загружаемые файлы пишутся на диск блоками при разборе запроса
+    app.request_class = UploadRequest
+    app.teardown_request(close_request_uploads)
     
     # Загружаем переменные среды
     load_dotenv()
@@ -38,6 +46,13 @@ def create_app(config_name='default'):
 
     # Регистрация контекстных процессоров и фильтров
     register_template_utils(app)
+
+    # Регистрация CLI-команд обслуживания
+    register_commands(app)
+
+    # Фоновая отправка писем и построение превью (потоки стартуют с первым запросом)
+    if app.config['MAIL_QUEUE_WORKER'] == 'thread':
+        init_workers(app, BACKGROUND_WORKERS)
     
     # Возвращаем сконфигурированное приложение
     return app
\ No newline at end of file
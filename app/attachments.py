@@ -0,0 +1,408 @@
+import hashlib
+import io
+import logging
+import mimetypes
+import os
+import shutil
+import tempfile
+import time
+
+from flask import Request, abort, current_app, redirect, request
+from sqlalchemy import select
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.utils import send_file
+
+from .extensions import db
+from .models import Attachment
+from .storage import LocalStorage, get_storage
+
+
+# Разрешенные расширения загружаемых файлов
+ALLOWED_EXTENSIONS = {'jpg', 'png', 'pdf', 'doc', 'docx', 'xls', 'xlsx'}
+
+# Тип по умолчанию, если по имени файла его определить нельзя
+DEFAULT_MIME_TYPE = 'application/octet-stream'
+
+# Размер блока при чтении и копировании файлов
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+# Папка хранилища по содержимому внутри папки загрузок: blobs/ab/cd/<sha256>
+BLOB_FOLDER = 'blobs'
+
+# Папка превью внутри папки загрузок: previews/ab/cd/<sha256>.jpg
+PREVIEW_FOLDER = 'previews'
+
+# Сколько секунд после записи файл не удаляется (ни сборщиком мусора, ни при удалении идеи):
+# ссылка на только что загруженный файл может быть еще не закоммичена
+BLOB_GC_GRACE = 3600
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+
+def allowed_file(filename):
+    """Проверяет, разрешено ли расширение файла."""
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+
+
+def guess_mime_type(filename):
+    """MIME-тип по расширению имени файла."""
+    return mimetypes.guess_type(filename)[0] or DEFAULT_MIME_TYPE
+
+
+def upload_folder():
+    """Абсолютный путь к папке загрузок (создается при необходимости)."""
+    path = os.path.join(current_app.root_path, current_app.config['UPLOAD_FOLDER'])
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def blob_prefix():
+    """Относительный путь к хранилищу по содержимому (с разделителем в конце)."""
+    return os.path.join(current_app.config['UPLOAD_FOLDER'], BLOB_FOLDER, '')
+
+
+def blob_path(sha256):
+    """Относительный путь к файлу с данным хешем (каталоги по первым байтам хеша)."""
+    return os.path.join(blob_prefix(), sha256[:2], sha256[2:4], sha256)
+
+
+def attachment_storage(filepath):
+    """
+    Хранилище, в котором лежит файл вложения. Файлы, загруженные до хранилища по содержимому,
+    остаются в локальной папке загрузок при любом ATTACHMENT_STORAGE (пока их не перенесет attachments dedupe).
+    """
+    if filepath.startswith(blob_prefix()):
+        return get_storage()
+    return LocalStorage(current_app.root_path)
+
+
+def stream_sha256(stream):
+    """SHA-256 потока, читаемого блоками (поток закрывается)."""
+    digest = hashlib.sha256()
+    with stream:
+        for chunk in iter(lambda: stream.read(UPLOAD_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class UploadStream:
+    """
+    Поток для загружаемого файла. Парсер запроса пишет в него блоки по мере чтения тела:
+    данные сразу уходят во временный файл в папке загрузок, попутно считаются размер и SHA-256.
+    Если файл не сохранен через save_to, временный файл удаляется при закрытии запроса.
+    """
+
+    def __init__(self, directory, max_size=None):
+        fd, self.temp_path = tempfile.mkstemp(dir=directory, prefix='.upload-')
+        self._file = os.fdopen(fd, 'w+b')
+        self._digest = hashlib.sha256()
+        self.size = 0
+        self.max_size = max_size
+
+    def write(self, data):
+        self.size += len(data)
+        if self.max_size and self.size > self.max_size:
+            self.close()
+            raise RequestEntityTooLarge(
+                f'Файл больше допустимого размера ({self.max_size // (1024 * 1024)} MB)'
+            )
+        self._digest.update(data)
+        return self._file.write(data)
+
+    @property
+    def sha256(self):
+        return self._digest.hexdigest()
+
+    def save_to(self, storage, key, content_type=None):
+        """Передает записанный файл в хранилище под ключом key."""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        storage.store(key, self.temp_path, content_type)
+        self.temp_path = None
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+        if self.temp_path:
+            try:
+                os.remove(self.temp_path)
+            except FileNotFoundError:
+                pass
+            self.temp_path = None
+
+    def __getattr__(self, name):
+        # read, seek, tell и прочее - от временного файла
+        return getattr(self._file, name)
+
+
+class DiscardedUpload(io.BytesIO):
+    """Поток для файла с недопустимым расширением: данные не сохраняются."""
+
+    def write(self, data):
+        return len(data)
+
+
+class UploadRequest(Request):
+    """
+    Запрос, в котором файлы пишутся на диск блоками прямо при разборе тела,
+    а файлы с недопустимым расширением отбрасываются, не занимая ни память, ни диск.
+    Все созданные потоки запоминаются: если разбор прерван (например, следующий файл
+    слишком большой), уже записанные файлы не попадают в request.files и закрываются здесь.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._upload_streams = []
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if not filename:
+            return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+        if not allowed_file(filename):
+            return DiscardedUpload()
+        max_size = current_app.config['UPLOAD_MAX_FILE_SIZE']
+        if max_size and content_length and content_length > max_size:
+            raise RequestEntityTooLarge()
+        stream = UploadStream(upload_folder(), max_size)
+        self._upload_streams.append(stream)
+        return stream
+
+    def _load_form_data(self):
+        try:
+            super()._load_form_data()
+        except Exception:
+            self.close_uploads()
+            raise
+
+    def close_uploads(self):
+        """Закрывает потоки загрузок и удаляет их временные файлы (сохраненные файлы не затрагиваются)."""
+        streams, self._upload_streams = self._upload_streams, []
+        for stream in streams:
+            stream.close()
+
+
+def close_request_uploads(exc=None):
+    """Обработчик teardown_request: временные файлы загрузок не переживают запрос."""
+    if isinstance(request, UploadRequest):
+        request.close_uploads()
+
+
+def save_upload(file):
+    """
+    Сохраняет загруженный файл в хранилище по содержимому.
+    Если файл с таким хешем уже есть, новый не записывается.
+    Возвращает (относительный путь, размер, SHA-256).
+    """
+    stream = file.stream
+    if not isinstance(stream, UploadStream):
+        # Файл пришел не через UploadRequest - копируем блоками с подсчетом хеша
+        source = stream
+        source.seek(0)
+        stream = UploadStream(upload_folder(), current_app.config['UPLOAD_MAX_FILE_SIZE'])
+        for chunk in iter(lambda: source.read(UPLOAD_CHUNK_SIZE), b''):
+            stream.write(chunk)
+
+    storage = get_storage()
+    filepath = blob_path(stream.sha256)
+    if storage.exists(filepath):
+        stream.close()
+        # Обновляем время изменения, чтобы сборщик мусора не удалил файл до коммита ссылки
+        storage.touch(filepath)
+    else:
+        stream.save_to(storage, filepath, guess_mime_type(file.filename or ''))
+    return filepath, stream.size, stream.sha256
+
+
+def send_attachment(attachment):
+    """
+    Ответ со скачиваемым файлом: ETag по хешу содержимого (304 на If-None-Match),
+    докачка по Range. В режимах X-Sendfile/X-Accel-Redirect сами байты отдает веб-сервер,
+    а для объектного хранилища - перенаправление на подписанную ссылку.
+    """
+    storage = attachment_storage(attachment.filepath)
+    mime_type = attachment.mime_type or guess_mime_type(attachment.filename)
+    url = storage.url(attachment.filepath, attachment.filename, mime_type)
+    if url:
+        return redirect(url)
+
+    path = storage.path(attachment.filepath)
+    if not os.path.exists(path):
+        abort(404)
+
+    mode = current_app.config['ATTACHMENT_SENDFILE']
+    response = send_file(
+        path,
+        request.environ,
+        mimetype=mime_type,
+        as_attachment=True,
+        download_name=attachment.filename,
+        # Содержимое файла по хешу неизменно, поэтому ETag строгий
+        etag=attachment.sha256 or True,
+        use_x_sendfile=mode != 'off',
+        response_class=current_app.response_class,
+        # Диапазоны в режиме X-Sendfile обрабатывает веб-сервер
+        conditional=mode == 'off'
+    )
+    # Сообщаем клиенту, что загрузку можно продолжить с места обрыва
+    response.accept_ranges = 'bytes'
+    if mode == 'off':
+        return response
+
+    response.make_conditional(request.environ)
+    sendfile_path = response.headers.pop('X-Sendfile')
+    if response.status_code == 304:
+        return response
+    if mode == 'x-accel':
+        # Внутренний location nginx, указывающий на папку загрузок
+        relative = os.path.relpath(sendfile_path, upload_folder()).replace(os.sep, '/')
+        response.headers['X-Accel-Redirect'] = current_app.config['ATTACHMENT_ACCEL_PREFIX'].rstrip('/') + '/' + relative
+    else:
+        response.headers['X-Sendfile'] = sendfile_path
+    return response
+
+
+def remove_attachment_files(filepaths, storage=None):
+    """
+    Удаляет из хранилища файлы, на которые больше не ссылается ни одно вложение.
+    Вызывается после коммита удаления вложений. Недавно записанные или обновленные файлы
+    хранилища по содержимому не трогаются: их может использовать еще не закоммиченная загрузка
+    того же файла, такие файлы позже удалит сборщик мусора. Возвращает число файлов, которые удалить не удалось.
+    """
+    filepaths = set(filepaths)
+    if not filepaths:
+        return 0
+    referenced = set(db.session.scalars(
+        select(Attachment.filepath).where(Attachment.filepath.in_(filepaths))
+    ))
+
+    deadline = time.time() - BLOB_GC_GRACE
+    failed = 0
+    for filepath in filepaths - referenced:
+        file_storage = storage or attachment_storage(filepath)
+        try:
+            if filepath.startswith(blob_prefix()):
+                if not file_storage.exists(filepath) or file_storage.mtime(filepath) > deadline:
+                    continue
+            file_storage.delete(filepath)
+        except Exception as e:
+            failed += 1
+            logger.warning(f"⚠️ Не удалось удалить файл {filepath}: {e}")
+    return failed
+
+
+def collect_garbage(dry_run=False):
+    """
+    Удаляет файлы и превью, на которые не ссылается ни одно вложение,
+    и временные файлы прерванных загрузок. Возвращает (удалено файлов, освобождено байт).
+    """
+    storage = get_storage()
+    deadline = time.time() - BLOB_GC_GRACE
+    removed = freed = 0
+
+    # Временные файлы загрузок всегда лежат в локальной папке
+    for entry in os.scandir(upload_folder()):
+        if not entry.is_file() or not entry.name.startswith('.upload-'):
+            continue
+        try:
+            stat = entry.stat()
+            if stat.st_mtime > deadline:
+                continue
+            if not dry_run:
+                os.remove(entry.path)
+        except FileNotFoundError:
+            continue
+        removed += 1
+        freed += stat.st_size
+
+    folders = (
+        (blob_prefix(), Attachment.filepath),
+        (os.path.join(current_app.config['UPLOAD_FOLDER'], PREVIEW_FOLDER, ''), Attachment.preview_path),
+    )
+    for prefix, column in folders:
+        referenced = set(db.session.scalars(
+            select(column).where(column.startswith(prefix, autoescape=True))
+        ))
+        for key, size, mtime in storage.list(prefix):
+            if key in referenced or mtime > deadline:
+                continue
+            if not dry_run:
+                storage.delete(key)
+            removed += 1
+            freed += size
+    return removed, freed
+
+
+def move_files_to_blobs(batch_size=500):
+    """
+    Переносит файлы, загруженные до хранилища по содержимому, в хранилище.
+    Одинаковые файлы сводятся к одному. Нужен заполненный хеш (attachments backfill).
+    Возвращает число перенесенных вложений.
+    """
+    storage = get_storage()
+    # Старые файлы лежат в локальной папке загрузок при любом хранилище
+    legacy = LocalStorage(current_app.root_path)
+    moved = 0
+    last_id = 0
+    while True:
+        batch = Attachment.query.filter(
+            Attachment.id > last_id,
+            Attachment.sha256.isnot(None),
+            ~Attachment.filepath.startswith(blob_prefix(), autoescape=True)
+        ).order_by(Attachment.id).limit(batch_size).all()
+        if not batch:
+            break
+
+        old_paths = []
+        for attachment in batch:
+            filepath = blob_path(attachment.sha256)
+            if not storage.exists(filepath):
+                if not legacy.exists(attachment.filepath):
+                    continue
+                # Копируем через временный файл: старый удаляется только после коммита
+                fd, temp_path = tempfile.mkstemp(dir=upload_folder(), prefix='.upload-')
+                os.close(fd)
+                shutil.copyfile(legacy.path(attachment.filepath), temp_path)
+                storage.store(filepath, temp_path, attachment.mime_type)
+            old_paths.append(attachment.filepath)
+            attachment.filepath = filepath
+            moved += 1
+
+        last_id = batch[-1].id
+        db.session.commit()
+        remove_attachment_files(old_paths, storage=legacy)
+
+    return moved
+
+
+def backfill_attachment_metadata(batch_size=500):
+    """
+    Заполняет размер, MIME-тип и SHA-256 для файлов, загруженных до появления этих колонок.
+    Возвращает (обновлено записей, файлов не найдено).
+    """
+    updated = missing = 0
+    last_id = 0
+    while True:
+        batch = Attachment.query.filter(
+            Attachment.id > last_id,
+            Attachment.size.is_(None) | Attachment.mime_type.is_(None) | Attachment.sha256.is_(None)
+        ).order_by(Attachment.id).limit(batch_size).all()
+        if not batch:
+            break
+
+        for attachment in batch:
+            storage = attachment_storage(attachment.filepath)
+            try:
+                attachment.size = storage.size(attachment.filepath)
+                attachment.sha256 = stream_sha256(storage.open(attachment.filepath))
+            except Exception:
+                # Файла нет в хранилище
+                attachment.size = attachment.size or 0
+                missing += 1
+            attachment.mime_type = attachment.mime_type or guess_mime_type(attachment.filename)
+            updated += 1
+
+        last_id = batch[-1].id
+        db.session.commit()
+
+    return updated, missing
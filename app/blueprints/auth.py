@@ -1,4 +1,4 @@
-from flask import Blueprint, render_template, redirect, url_for, session, flash
+from flask import Blueprint, render_template, redirect, url_for, session, flash, g, abort
 from functools import wraps
 from sqlalchemy import select
 from app.extensions import db
@@ -7,6 +7,14 @@ from app.models import Moderator
 
 auth_bp = Blueprint("auth", __name__, url_prefix="/moderator")
 
+def get_current_moderator():
+    """Текущий модератор (загружается из базы один раз за запрос и хранится в g)."""
+    if 'moderator' not in g:
+        moderator_id = session.get('moderator_id')
+        g.moderator = db.session.get(Moderator, moderator_id) if moderator_id else None
+    return g.moderator
+
+
 def moderator_required(f):
     """Декоратор для проверки авторизации модератора."""
     @wraps(f)
@@ -15,7 +23,7 @@ def moderator_required(f):
             flash('Требуется авторизация модератора', 'warning')
             return redirect(url_for('auth.login'))
             
-        moderator = db.session.get(Moderator, session['moderator_id'])
+        moderator = get_current_moderator()
         if not moderator:
             session.pop('moderator_id', None)
             flash('Сессия устарела, войдите снова', 'warning')
@@ -24,6 +32,16 @@ def moderator_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+
+def category_manager_required(f):
+    """Декоратор для проверки права управлять категориями (после moderator_required)."""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not get_current_moderator().can_manage_categories:
+            abort(403)
+        return f(*args, **kwargs)
+    return decorated_function
+
 @auth_bp.route('/login', methods=['GET', 'POST'])
 def login():
     """Страница входа для модераторов."""
@@ -37,6 +55,7 @@ def login():
         ).scalar_one_or_none()
         if moderator and moderator.check_password(form.password.data):
             session['moderator_id'] = moderator.id
+            g.moderator = moderator
             flash(f'Добро пожаловать, {moderator.full_name}!', 'success')
             return redirect(url_for('public.index'))
         flash('Неверные учетные данные', 'danger')
@@ -46,5 +65,6 @@ def login():
 def logout():
     """Выход из системы модератора."""
     session.pop('moderator_id', None)
+    g.pop('moderator', None)
     flash('Вы вышли из режима модератора', 'info')
     return redirect(url_for('public.index'))
\ No newline at end of file
@@ -1,30 +1,19 @@
-from flask import Blueprint, render_template, request, flash, redirect, url_for, abort, current_app, jsonify, send_file, send_from_directory
+from flask import Blueprint, render_template, request, flash, redirect, url_for, abort, jsonify, send_file
 from functools import wraps
 from io import BytesIO
-import os
 from werkzeug.utils import secure_filename
 
+from app.attachments import allowed_file, guess_mime_type, save_upload, send_attachment
 from app.extensions import db
 from app.forms import IdeaForm
 from app.models import Attachment, Idea, IdeaCategory
+from app.previews import PREVIEW_PENDING, needs_preview, send_preview
 from app.notifications import send_new_idea_notification, send_author_confirmation, send_status_update_notification
+from app.search import index_idea
 
 from config import Config
 
 
-# Конфигурация
-ALLOWED_EXTENSIONS = {'jpg', 'png', 'pdf', 'doc', 'docx', 'xls', 'xlsx'}
-
-
-# Создаем папку для загрузок
-# os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-
-
-# Вспомогательные функции
-def allowed_file(filename):
-    """Проверяет, разрешено ли расширение файла."""
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
-
 ideas_bp = Blueprint("ideas", __name__)
 
 
@@ -48,7 +37,7 @@ def add_idea():
                 author_name=form.author_name.data.strip() if form.author_name.data else None,
                 contact_email=form.contact_email.data.strip() if form.contact_email.data else None,
                 is_anonymous=False,
-                category=form.category.data,
+                category_id=form.category.data,
                 status=Idea.STATUS_PENDING
             )
             
@@ -62,27 +51,34 @@ def add_idea():
                     if file and file.filename and allowed_file(file.filename):
                         filename = secure_filename(file.filename)
                         
-                        UPLOAD_FOLDER = 'uploads' 
-                        filepath = os.path.join(UPLOAD_FOLDER, f"{idea.id}_{filename}")
-                        
-                        # Сохраняем файл (папка уже создана run.py)
-                        file.save(filepath)
+                        # Файл уже записан на диск при разборе запроса (с подсчетом размера и хеша),
+                        # здесь он переносится в хранилище по хешу; одинаковые файлы хранятся один раз
+                        filepath, size, sha256 = save_upload(file)
+                        mime_type = guess_mime_type(filename)
                         
+                        # Превью строит фоновый обработчик после коммита
                         attachment = Attachment(
                             filename=filename,
                             filepath=filepath,
-                            idea_id=idea.id
+                            idea_id=idea.id,
+                            size=size,
+                            sha256=sha256,
+                            mime_type=mime_type,
+                            preview_state=PREVIEW_PENDING if needs_preview(mime_type) else None
                         )
                         db.session.add(attachment)
             
-            db.session.commit()
+            # Индексируем идею для поиска в той же транзакции
+            index_idea(idea)
 
-            # Уведомление модератору
+            # Уведомление модератору (письма ставятся в очередь в той же транзакции)
             send_new_idea_notification(idea)
             
             # Подтверждение автору (если указан email)
             send_author_confirmation(idea)
             
+            db.session.commit()
+            
             flash('Идея успешно отправлена на модерацию!', 'success')
             return redirect(url_for('public.index'))
             
@@ -98,10 +94,13 @@ def add_idea():
 def download_attachment(id):
     """Скачивание прикрепленного файла."""
     attachment = Attachment.query.get_or_404(id)
-    if not os.path.exists(os.path.join(current_app.root_path, attachment.filepath)):
+    return send_attachment(attachment)
+
+
+@ideas_bp.route('/attachment/<int:id>/preview')
+def attachment_preview(id):
+    """Превью прикрепленного файла."""
+    attachment = Attachment.query.get_or_404(id)
+    if not attachment.preview_path:
         abort(404)
-    return send_from_directory(
-        os.path.dirname(os.path.join(current_app.root_path, attachment.filepath)),
-        os.path.basename(attachment.filepath),
-        as_attachment=True
-    )
\ No newline at end of file
+    return send_preview(attachment)
\ No newline at end of file
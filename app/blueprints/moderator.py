@@ -1,17 +1,29 @@
-from flask import Blueprint, render_template, request, flash, redirect, url_for, abort, current_app, jsonify, send_file, session
+from flask import Blueprint, Response, render_template, request, flash, redirect, url_for, abort, current_app, jsonify, stream_with_context
 from functools import wraps
-from io import BytesIO
 import os
+import tempfile
 from werkzeug.utils import secure_filename
-from openpyxl import Workbook
 from datetime import datetime
-from sqlalchemy import func
+from sqlalchemy import func, update
+from sqlalchemy.orm import selectinload
 
+from app.attachments import remove_attachment_files
 from app.extensions import db
 from app.forms import CategoryForm, DeleteCategoryForm, EditCategoryForm, EditIdeaForm
-from app.models import Attachment, Idea, IdeaCategory, Moderator
+from app.models import Idea, IdeaCategory
+from app.moderation import (
+    BULK_ACTIONS, BULK_PUBLISH_ACTIONS, BULK_STATUS_ACTIONS,
+    bulk_delete, bulk_set_published, bulk_set_status
+)
 from app.notifications import send_status_update_notification
-from .auth import moderator_required
+from app.search import index_idea, remove_idea
+from app.cache import CONTENT_VERSION, bump_version
+from app.categories import active_categories
+from app.counters import count_ideas, move_category_counters
+from app.pagination import cursor_paginate
+from app.exports import EXPORT_CHUNK_SIZE, export_query, filtered_ideas_query, generate_csv, generate_ndjson, write_xlsx
+from app.stats import collect_idea_stats
+from .auth import category_manager_required, moderator_required
 
 moderator_bp = Blueprint("moderator", __name__, url_prefix="/moderator")
 
@@ -26,50 +38,52 @@ def dashboard():
     
     status_filter = request.args.get('status', 'all')
     published_filter = request.args.get('published', 'all')
-    category_filter = request.args.get('category', 'all')
+    category_filter = request.args.get('category', type=int)
     
     # Параметры сортировки
     sort_field = request.args.get('sort', 'created_at')
     sort_direction = request.args.get('dir', 'desc')
     
-    # Формируем базовый запрос
-    query = Idea.query
+    # Формируем запрос с фильтрами
+    query = filtered_ideas_query(status_filter, category_filter, published_filter)
     
-    # Применяем фильтры
-    if status_filter != 'all':
-        query = query.filter(Idea.status == status_filter)
-    
-    if published_filter == 'published':
-        query = query.filter(Idea.is_published == True)
-    elif published_filter == 'unpublished':
-        query = query.filter(Idea.is_published == False)
-    
-    if category_filter != 'all':
-        query = query.filter(Idea.category == category_filter)
+    # Категории подгружаем одним запросом на страницу
+    query = query.options(selectinload(Idea.category))
     
     # Применяем сортировку
     if sort_field == 'title':
         field = Idea.title
     elif sort_field == 'author':
-        field = Idea.author_name
+        # Автор может быть не указан: NULL не годится для сравнения по курсору
+        field = func.coalesce(Idea.author_name, '')
     elif sort_field == 'category':
-        field = Idea.category
+        query = query.join(Idea.category)
+        field = IdeaCategory.name
     elif sort_field == 'status':
         field = Idea.status
     else:  # по умолчанию сортируем по дате
         field = Idea.created_at
     
-    if sort_direction == 'asc':
-        query = query.order_by(field.asc())
+    # Применяем пагинацию; id — уникальный ключ для строк с одинаковым значением поля
+    if current_app.config['PAGINATION_MODE'] == 'cursor':
+        pagination = cursor_paginate(
+            query,
+            keys=[field, Idea.id],
+            descending=sort_direction != 'asc',
+            cursor=request.args.get('cursor'),
+            per_page=per_page,
+            count_total=current_app.config['PAGINATION_COUNT_TOTAL']
+        )
     else:
-        query = query.order_by(field.desc())
-    
-    # Применяем пагинацию
-    pagination = query.paginate(page=page, per_page=per_page, error_out=False)
+        if sort_direction == 'asc':
+            query = query.order_by(field.asc(), Idea.id.asc())
+        else:
+            query = query.order_by(field.desc(), Idea.id.desc())
+        pagination = query.paginate(page=page, per_page=per_page, error_out=False)
     ideas = pagination.items
     
     # Получаем список категорий для фильтра
-    categories = IdeaCategory.query.filter_by(is_active=True).order_by(IdeaCategory.name).all()
+    categories = active_categories()
     
     return render_template('dashboard.html', 
                          ideas=ideas,
@@ -84,118 +98,114 @@ def dashboard():
 @moderator_required
 def stats():
     """Страница статистики."""
-    # Категориальная статистика
-    categories = [cat.name for cat in IdeaCategory.query.filter_by(is_active=True).all()]
-    category_counts = [Idea.query.filter_by(category=cat).count() for cat in categories]
+    # Статусы и категории по счетчикам, динамика по месяцам одним запросом
+    idea_stats = collect_idea_stats()
+    monthly = collect_idea_stats(period='month').series()
     
-    # Статистика по статусам
-    total_ideas = Idea.query.count()
-    pending_ideas = Idea.query.filter_by(status=Idea.STATUS_PENDING).count()
-    approved_ideas = Idea.query.filter_by(status=Idea.STATUS_APPROVED).count()
-    partially_approved_ideas = Idea.query.filter_by(status=Idea.STATUS_PARTIALLY_APPROVED).count()
-    in_progress_ideas = Idea.query.filter_by(status=Idea.STATUS_IN_PROGRESS).count()
-    implemented_ideas = Idea.query.filter_by(status=Idea.STATUS_IMPLEMENTED).count()
-    rejected_ideas = Idea.query.filter_by(status=Idea.STATUS_REJECTED).count()
+    # Категориальная статистика
+    categories = [cat.name for cat in active_categories()]
+    category_counts = [idea_stats.by_category[cat.id] for cat in active_categories()]
     
     return render_template('stats.html', 
+                         stats=idea_stats,
                          categories=categories,
                          category_counts=category_counts,
-                         total_ideas=total_ideas,
-                         pending_ideas=pending_ideas,
-                         approved_ideas=approved_ideas,
-                         partially_approved_ideas=partially_approved_ideas,
-                         in_progress_ideas=in_progress_ideas,
-                         implemented_ideas=implemented_ideas,
-                         rejected_ideas=rejected_ideas)
+                         monthly=monthly)
+
+
+def _stream_file(path, chunk_size=EXPORT_CHUNK_SIZE):
+    """Отдает файл частями."""
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
+def _remove_file(path):
+    """Удаляет временный файл выгрузки (если он еще есть)."""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
 
 
 @moderator_bp.route('/export-ideas')
 @moderator_required
 def export_ideas():
     """Экспорт идей в Excel."""
+    path = None
     try:
         # Получаем параметры фильтрации
         status = request.args.get('status', 'all')
-        category = request.args.get('category', 'all')
-        
-        # Формируем запрос с фильтрами
-        query = Idea.query
-        if status != 'all':
-            query = query.filter(Idea.status == status)
-        if category != 'all':
-            query = query.filter(Idea.category == category)
-        
-        ideas = query.order_by(Idea.created_at.desc()).all()
+        category_id = request.args.get('category', type=int)
         
-        # Создаем Excel-файл
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Идеи"
-        
-        # Заголовки
-        headers = [
-            "ID", "Заголовок", "Проблема", "Решение", "Дополнительно",
-            "Автор", "Категория", "Статус", "Дата создания",
-            "Кол-во файлов"
-        ]
-        ws.append(headers)
-        
-        # Данные
-        for idea in ideas:
-            ws.append([
-                idea.id,
-                idea.title,
-                idea.essence,
-                idea.solution,
-                idea.description or "",
-                idea.author_name or "",
-                "Да" if idea.is_anonymous else "Нет",
-                idea.category,
-                idea.status_display(),
-                idea.created_at.strftime('%d.%m.%Y %H:%M'),
-                len(idea.attachments)
-            ])
-        
-        # Оптимальные ширины столбцов (уменьшенные)
-        column_widths = {
-            'A': 6,   # ID
-            'B': 20,  # Заголовок
-            'C': 40,  # Проблема
-            'D': 40,  # Решение
-            'E': 40,  # Дополнительно
-            'F': 15,  # Автор
-            'H': 15,  # Категория
-            'I': 15,  # Статус
-            'J': 15,  # Дата создания
-            'K': 10   # Кол-во файлов
-        }
-        
-        # Устанавливаем ширины столбцов
-        for col_letter, width in column_widths.items():
-            ws.column_dimensions[col_letter].width = width
-        
-        # Сохраняем в буфер
-        buffer = BytesIO()
-        wb.save(buffer)
-        buffer.seek(0)
+        # Сохраняем во временный файл
+        fd, path = tempfile.mkstemp(suffix='.xlsx')
+        os.close(fd)
+        write_xlsx(export_query(status, category_id), path)
+        size = os.path.getsize(path)
         
         # Формируем имя файла
-        filename = f"ideas_export_{datetime.now().strftime('%Y-%m-%d_%H-%M')}.xlsx"
+        filename = _export_filename('xlsx')
         
-        # Отправляем файл
-        return send_file(
-            buffer,
-            as_attachment=True,
-            download_name=filename,
-            mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        # Отправляем файл частями
+        response = Response(
+            _stream_file(path),
+            mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            headers={
+                'Content-Disposition': f'attachment; filename={filename}',
+                'Content-Length': str(size)
+            }
         )
+        # Файл удаляется при закрытии ответа, даже если отправка не началась (HEAD, обрыв соединения)
+        response.call_on_close(lambda: _remove_file(path))
+        return response
         
     except Exception as e:
+        if path and os.path.exists(path):
+            os.remove(path)
         current_app.logger.error(f"Ошибка при экспорте идей: {str(e)}")
         flash('Произошла ошибка при формировании отчета', 'danger')
         return redirect(url_for('public.index'))
 
 
+def _export_filename(extension):
+    """Имя файла выгрузки с текущей датой."""
+    return f"ideas_export_{datetime.now().strftime('%Y-%m-%d_%H-%M')}.{extension}"
+
+
+@moderator_bp.route('/export-ideas/csv')
+@moderator_required
+def export_ideas_csv():
+    """Потоковая выгрузка идей в CSV."""
+    query = filtered_ideas_query(
+        request.args.get('status', 'all'),
+        request.args.get('category', type=int)
+    )
+    return Response(
+        stream_with_context(generate_csv(query)),
+        mimetype='text/csv',
+        headers={'Content-Disposition': f'attachment; filename={_export_filename("csv")}'}
+    )
+
+
+@moderator_bp.route('/export-ideas/ndjson')
+@moderator_required
+def export_ideas_ndjson():
+    """Потоковая выгрузка идей в NDJSON (одна идея на строку)."""
+    query = filtered_ideas_query(
+        request.args.get('status', 'all'),
+        request.args.get('category', type=int)
+    )
+    return Response(
+        stream_with_context(generate_ndjson(query)),
+        mimetype='application/x-ndjson; charset=utf-8',
+        headers={'Content-Disposition': f'attachment; filename={_export_filename("ndjson")}'}
+    )
+
+
 # Маршруты управления идеями (модератор)
 @moderator_bp.route('/idea/<int:id>/toggle_publish', methods=['POST'])
 @moderator_required
@@ -230,23 +240,28 @@ def edit_idea(id):
         idea.essence = form.essence.data
         idea.solution = form.solution.data
         idea.description = form.description.data
-        idea.category = form.category.data
+        # Присваиваем связь, а не только category_id: письмо о статусе собирается до коммита
+        # и должно показать новую категорию
+        idea.category = db.session.get(IdeaCategory, form.category.data)
         idea.status = form.status.data
         
         # Восстанавливаем is_published
         idea.is_published = was_published
         
-        db.session.commit()
+        # Обновляем поисковый индекс
+        index_idea(idea)
 
         send_status_update_notification(idea, old_status, idea.status)
         
+        db.session.commit()
+        
         flash('Изменения сохранены', 'success')
         return redirect(url_for('public.idea_detail', id=id))
     
     # Убедимся, что поля формы заполнены текущими значениями
     form.moderator_feedback.data = idea.moderator_feedback
     form.status.data = idea.status
-    form.category.data = idea.category
+    form.category.data = idea.category_id
     
     return render_template('edit_idea.html', form=form, idea=idea)
 
@@ -259,10 +274,10 @@ def approve_idea(id):
         idea = db.session.get(Idea, id) or abort(404)
         old_status = idea.status
         idea.status = Idea.STATUS_APPROVED
-        db.session.commit()
 
-        # 🔔 Уведомление автору об изменении статуса
+        # 🔔 Уведомление автору об изменении статуса (в очередь, вместе с коммитом)
         send_status_update_notification(idea, old_status, idea.status)
+        db.session.commit()
 
         flash('Идея одобрена', 'success')
     except Exception as e:
@@ -279,10 +294,10 @@ def partially_approve_idea(id):
         idea = db.session.get(Idea, id) or abort(404)
         old_status = idea.status
         idea.status = Idea.STATUS_PARTIALLY_APPROVED
-        db.session.commit()
 
-        # 🔔 Уведомление автору об изменении статуса
+        # 🔔 Уведомление автору об изменении статуса (в очередь, вместе с коммитом)
         send_status_update_notification(idea, old_status, idea.status)
+        db.session.commit()
 
         flash('Идея одобрена частично', 'info')
     except Exception as e:
@@ -299,9 +314,9 @@ def reject_idea(id):
         idea = db.session.get(Idea, id) or abort(404)
         old_status = idea.status
         idea.status = Idea.STATUS_REJECTED
-        db.session.commit()
 
         send_status_update_notification(idea, old_status, idea.status)
+        db.session.commit()
 
         flash('Идея отклонена', 'warning')
     except Exception as e:
@@ -316,17 +331,15 @@ def delete_idea(id):
     """Удаление идеи."""
     try:
         idea = db.session.get(Idea, id) or abort(404)
+        filepaths = [attachment.filepath for attachment in idea.attachments]
         
-        # Удаляем связанные файлы
-        for attachment in idea.attachments:
-            if os.path.exists(os.path.join(current_app.root_path, attachment.filepath)):
-                try:
-                    os.remove(os.path.join(current_app.root_path, attachment.filepath))
-                except Exception as e:
-                    flash(f'Ошибка при удалении файла: {str(e)}', 'warning')
-        
+        remove_idea(idea.id)
         db.session.delete(idea)
         db.session.commit()
+        
+        # Файлы удаляем после коммита, и только те, на которые не ссылаются другие идеи
+        if remove_attachment_files(filepaths):
+            flash('Не все файлы идеи удалось удалить с диска', 'warning')
         flash('Идея и все связанные материалы удалены', 'danger')
     except Exception as e:
         db.session.rollback()
@@ -334,28 +347,83 @@ def delete_idea(id):
     return redirect(url_for('moderator.dashboard'))
 
 
+@moderator_bp.route('/ideas/bulk', methods=['POST'])
+@moderator_required
+def bulk_action():
+    """Массовое действие над выбранными идеями (одна транзакция)."""
+    data = request.get_json(silent=True) if request.is_json else None
+    if data is not None:
+        action, raw_ids = data.get('action'), data.get('ids') or []
+    else:
+        action, raw_ids = request.form.get('action'), request.form.getlist('ids')
+    idea_ids = sorted({int(value) for value in raw_ids if str(value).isdigit()})
+
+    next_url = request.form.get('next') or ''
+    if not next_url.startswith('/') or next_url.startswith('//'):
+        next_url = url_for('moderator.dashboard')
+
+    if action not in BULK_ACTIONS or not idea_ids:
+        if data is not None:
+            return jsonify({'success': False, 'error': 'Не выбраны идеи или действие'}), 400
+        flash('Выберите идеи и действие', 'warning')
+        return redirect(next_url)
+
+    filepaths = []
+    try:
+        if action in BULK_STATUS_ACTIONS:
+            changed = bulk_set_status(idea_ids, BULK_STATUS_ACTIONS[action])
+        elif action in BULK_PUBLISH_ACTIONS:
+            changed = bulk_set_published(idea_ids, BULK_PUBLISH_ACTIONS[action])
+        else:
+            changed, filepaths = bulk_delete(idea_ids)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Ошибка массового действия {action}: {str(e)}")
+        if data is not None:
+            return jsonify({'success': False, 'error': str(e)}), 500
+        flash(f'Ошибка при выполнении действия: {str(e)}', 'danger')
+        return redirect(next_url)
+
+    # Файлы удаляем только после успешного коммита
+    failed_files = remove_attachment_files(filepaths)
+
+    if data is not None:
+        return jsonify({'success': True, 'changed': changed, 'failed_files': failed_files})
+
+    messages = {
+        'approve': 'Одобрено идей',
+        'partially_approve': 'Частично одобрено идей',
+        'reject': 'Отклонено идей',
+        'publish': 'Опубликовано идей',
+        'unpublish': 'Снято с публикации идей',
+        'delete': 'Удалено идей',
+    }
+    flash(f'{messages[action]}: {changed}', 'success')
+    if failed_files:
+        flash(f'Не удалось удалить файлов: {failed_files}', 'warning')
+    return redirect(next_url)
+
+
 # Маршруты управления категориями
 @moderator_bp.route('/manage_categories')
 @moderator_required
+@category_manager_required
 def manage_categories():
     """Управление категориями идей."""
-    moderator = db.session.get(Moderator, session['moderator_id'])
-    if not moderator.can_manage_categories:
-        abort(403)
-        
-    categories = IdeaCategory.query.filter_by(is_active=True).order_by(IdeaCategory.name).all()
+    categories = active_categories()
     add_form = CategoryForm()
     delete_form = DeleteCategoryForm()
     
-    # Подсчитываем количество идей для каждой категории
+    # Количество идей для всех категорий по счетчикам
+    idea_stats = collect_idea_stats()
     categories_with_counts = []
     for category in categories:
-        ideas_count = Idea.query.filter_by(category=category.name).count()
         categories_with_counts.append({
             'id': category.id,
             'name': category.name,
             'description': category.description,
-            'ideas_count': ideas_count
+            'ideas_count': idea_stats.by_category[category.id]
         })
     
     return render_template('manage_categories.html', 
@@ -366,12 +434,9 @@ def manage_categories():
 
 @moderator_bp.route('/add_category', methods=['POST'])
 @moderator_required
+@category_manager_required
 def add_category():
     """Добавление новой категории."""
-    moderator = db.session.get(Moderator, session['moderator_id'])
-    if not moderator.can_manage_categories:
-        abort(403)
-        
     form = CategoryForm()
     if form.validate_on_submit():
         try:
@@ -400,17 +465,14 @@ def add_category():
 
 @moderator_bp.route('/edit_category/<int:id>', methods=['GET', 'POST'])
 @moderator_required
+@category_manager_required
 def edit_category(id):
     """Редактирование категории."""
-    moderator = db.session.get(Moderator, session['moderator_id'])
-    if not moderator.can_manage_categories:
-        abort(403)
-        
     category = IdeaCategory.query.get_or_404(id)
     form = CategoryForm(obj=category)
     
-    # Подсчитываем количество идей для этой категории
-    ideas_count = Idea.query.filter_by(category=category.name).count()
+    # Количество идей в категории по счетчикам
+    ideas_count = count_ideas(category_id=category.id)
     
     if form.validate_on_submit():
         try:
@@ -423,17 +485,10 @@ def edit_category(id):
             if existing_category:
                 flash('Категория с таким названием уже существует', 'danger')
             else:
-                # Обновляем категорию
-                old_name = category.name
+                # Обновляем категорию: идеи ссылаются на нее по id и не меняются
                 category.name = form.name.data.strip()
                 category.description = form.description.data.strip() if form.description.data else None
                 
-                # Обновляем категорию у всех связанных идей
-                if old_name != category.name:
-                    ideas_to_update = Idea.query.filter_by(category=old_name).all()
-                    for idea in ideas_to_update:
-                        idea.category = category.name
-                
                 db.session.commit()
                 flash('Категория успешно обновлена', 'success')
                 return redirect(url_for('moderator.manage_categories'))
@@ -450,19 +505,13 @@ def edit_category(id):
 
 @moderator_bp.route('/delete_category/<int:id>', methods=['POST'])
 @moderator_required
+@category_manager_required
 def delete_category(id):
     """Удаление категории."""
-    moderator = db.session.get(Moderator, session['moderator_id'])
-    if not moderator.can_manage_categories:
-        abort(403)
-        
     form = DeleteCategoryForm()
     if form.validate_on_submit():
         category = IdeaCategory.query.get_or_404(id)
         
-        # Находим идеи в этой категории
-        ideas_in_category = Idea.query.filter_by(category=category.name).all()
-        
         try:
             # Ищем другую активную категорию для перемещения идей
             other_category = IdeaCategory.query.filter(
@@ -472,21 +521,27 @@ def delete_category(id):
             
             if other_category:
                 new_category = other_category.name
-                # Перемещаем категорию у всех идей в этой категории
-                for idea in ideas_in_category:
-                    idea.category = new_category
+                # Перемещаем идеи одним UPDATE, не загружая их в сессию
+                moved = db.session.execute(
+                    update(Idea)
+                    .where(Idea.category_id == category.id)
+                    .values(category_id=other_category.id),
+                    execution_options={'synchronize_session': False}
+                ).rowcount
+                move_category_counters(db.session.connection(), category.id, other_category.id)
+                bump_version(db.session.connection(), CONTENT_VERSION)
                 
                 # Удаляем саму категорию
                 db.session.delete(category)
                 db.session.commit()
                 
-                if ideas_in_category:
-                    flash(f'Категория "{category.name}" удалена. {len(ideas_in_category)} идей перемещено в категорию "{new_category}".', 'success')
+                if moved:
+                    flash(f'Категория "{category.name}" удалена. {moved} идей перемещено в категорию "{new_category}".', 'success')
                 else:
                     flash(f'Категория "{category.name}" успешно удалена', 'success')
             else:
                 # Если это последняя категория и в ней есть идеи, нельзя удалить
-                if ideas_in_category:
+                if count_ideas(category_id=category.id):
                     flash('Нельзя удалить последнюю категорию, в которой есть идеи. Сначала создайте новую категорию или удалите/переместите идеи.', 'danger')
                 else:
                     # Если это последняя категория и она пустая - можно удалить
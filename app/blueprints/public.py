@@ -1,14 +1,42 @@
-from flask import Blueprint, render_template, request, abort, session
-from app.models import Idea, IdeaCategory, Moderator
+from flask import Blueprint, current_app, render_template, request, abort, session
+from sqlalchemy.orm import selectinload
+from app.categories import CATEGORIES_VERSION, active_categories
+from app.cache import CONTENT_VERSION, cached_page, conditional_page, get_version, version_updated_at
+from app.models import Idea
 from app.extensions import db
-from sqlalchemy import or_
+from app.exports import filtered_ideas_query
+from app.pagination import cursor_paginate
+from app.search import apply_search
+from .auth import get_current_moderator
 
 
 # Объявляем блупринт 
 public_bp = Blueprint("public", __name__)
 
 
+def _index_validators():
+    """ETag и Last-Modified списка идей: общая версия опубликованного содержимого."""
+    return f'content-{get_version(CONTENT_VERSION)}', version_updated_at(CONTENT_VERSION)
+
+
+def _idea_validators(id):
+    """
+    ETag и Last-Modified страницы идеи по дате ее изменения и версии категорий
+    (переименование категории меняет страницу, но не строки идей).
+    """
+    idea = db.session.get(Idea, id)
+    if idea is None or not idea.is_published:
+        return None, None
+    updated_at = idea.updated_at or idea.created_at
+    categories_updated_at = version_updated_at(CATEGORIES_VERSION)
+    last_modified = max(updated_at, categories_updated_at) if categories_updated_at else updated_at
+    etag = f'idea-{idea.id}-{updated_at:%Y%m%d%H%M%S%f}-categories-{get_version(CATEGORIES_VERSION)}'
+    return etag, last_modified
+
+
 @public_bp.route('/')
+@conditional_page(_index_validators)
+@cached_page
 def index():
     """Главная страница со списком идей."""
     page = request.args.get('page', 1, type=int)
@@ -18,38 +46,44 @@ def index():
     status_filter = request.args.get('status', 'all')
     category_filter = request.args.get('category', 'all')
     search_query = request.args.get('search', '')
-    sort_by = request.args.get('sort', 'newest')
+    sort_by = request.args.get('sort', 'relevance' if search_query else 'newest')
 
     # Для ВСЕХ пользователей (включая модераторов) показываем только опубликованные идеи на главной
-    query = Idea.query.filter_by(is_published=True)
+    category_id = request.args.get('category', type=int)
+    query = filtered_ideas_query(status_filter, category_id, published='published')
 
-    # Применяем фильтры
-    if status_filter != 'all':
-        query = query.filter(Idea.status == status_filter)
-
-    if category_filter != 'all':
-        query = query.filter(Idea.category == category_filter)
+    # Категории подгружаем одним запросом на страницу
+    query = query.options(selectinload(Idea.category))
 
+    # Полнотекстовый поиск по индексу
+    rank = None
     if search_query:
-        query = query.filter(or_(
-            Idea.title.ilike(f'%{search_query}%'),
-            Idea.essence.ilike(f'%{search_query}%'),
-            Idea.solution.ilike(f'%{search_query}%'),
-            Idea.description.ilike(f'%{search_query}%')
-        ))
-
-    # Применяем сортировку
-    if sort_by == 'newest':
-        query = query.order_by(Idea.created_at.desc())
-    else:
-        query = query.order_by(Idea.created_at.asc())
+        query, rank = apply_search(query, search_query)
 
-    # Пагинация
-    pagination = query.paginate(page=page, per_page=per_page, error_out=False)
+    # Сортировка и пагинация. Результаты поиска по релевантности листаются
+    # по номерам страниц: ранг вычисляется в запросе и не годится как ключ курсора
+    if sort_by == 'relevance' and rank is not None:
+        query = query.order_by(rank, Idea.created_at.desc())
+        pagination = query.paginate(page=page, per_page=per_page, error_out=False)
+    elif current_app.config['PAGINATION_MODE'] == 'cursor':
+        pagination = cursor_paginate(
+            query,
+            keys=[Idea.created_at, Idea.id],
+            descending=sort_by != 'oldest',
+            cursor=request.args.get('cursor'),
+            per_page=per_page,
+            count_total=current_app.config['PAGINATION_COUNT_TOTAL']
+        )
+    else:
+        if sort_by == 'oldest':
+            query = query.order_by(Idea.created_at.asc(), Idea.id.asc())
+        else:
+            query = query.order_by(Idea.created_at.desc(), Idea.id.desc())
+        pagination = query.paginate(page=page, per_page=per_page, error_out=False)
     ideas = pagination.items
 
     # Получаем список категорий для фильтра
-    categories = IdeaCategory.query.filter_by(is_active=True).order_by(IdeaCategory.name).all()
+    categories = active_categories()
 
     return render_template('index.html', 
                          ideas=ideas,
@@ -62,6 +96,8 @@ def index():
 
 
 @public_bp.route('/idea/<int:id>')
+@conditional_page(_idea_validators)
+@cached_page
 def idea_detail(id):
     """Детальная страница идеи."""
     idea = db.session.get(Idea, id) or abort(404)
@@ -70,12 +106,8 @@ def idea_detail(id):
     if not session.get('moderator_id') and not idea.is_published:
         abort(403)
     
-    current_moderator = None
-    if 'moderator_id' in session:
-        current_moderator = db.session.get(Moderator, session['moderator_id'])
-    
     return render_template(
         'idea_detail.html', 
         idea=idea,
-        current_moderator=current_moderator
+        current_moderator=get_current_moderator()
     )
\ No newline at end of file
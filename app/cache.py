@@ -0,0 +1,269 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from functools import wraps
+from urllib.parse import urlencode
+
+from flask import current_app, g, has_app_context, make_response, request, session
+from sqlalchemy import event, inspect, select
+from werkzeug.http import is_resource_modified
+
+from .extensions import db
+from .models import Attachment, CacheVersion, Idea, IdeaCategory
+
+
+# Версия опубликованного содержимого (публичные страницы)
+CONTENT_VERSION = 'content'
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+
+def _version_row(name):
+    """
+    Версия данных и время ее изменения. Все версии читаются из базы
+    одним запросом один раз за запрос.
+    """
+    versions = g.get('cache_versions')
+    if versions is None:
+        rows = db.session.execute(select(CacheVersion.name, CacheVersion.version, CacheVersion.updated_at))
+        versions = {row.name: (row.version, row.updated_at) for row in rows}
+        g.cache_versions = versions
+    return versions.get(name, (0, None))
+
+
+def get_version(name):
+    """Текущая версия данных."""
+    return _version_row(name)[0]
+
+
+def version_updated_at(name):
+    """Когда версия данных менялась последний раз (UTC)."""
+    return _version_row(name)[1]
+
+
+def bump_version(connection, name):
+    """
+    Увеличивает версию в текущей транзакции: кэши, построенные на старой версии,
+    перестают использоваться во всех процессах после коммита.
+    """
+    table = CacheVersion.__table__
+    now = datetime.utcnow()
+    result = connection.execute(
+        table.update().where(table.c.name == name).values(version=table.c.version + 1, updated_at=now)
+    )
+    if result.rowcount == 0:
+        connection.execute(table.insert().values(name=name, version=1, updated_at=now))
+    if has_app_context():
+        g.pop('cache_versions', None)
+
+
+def _is_public_idea(session, idea):
+    """Видна ли идея посетителям сейчас или была видна до текущего изменения."""
+    if idea is None:
+        return False
+    if idea in session.new:
+        return bool(idea.is_published)
+    history = inspect(idea).attrs.is_published.history
+    if history.added and not history.deleted and not history.unchanged:
+        # Признак изменен до загрузки старого значения - считаем, что публикация поменялась
+        return True
+    return bool(idea.is_published) or any(history.deleted)
+
+
+def _changes_public_content(session, obj):
+    """
+    Меняет ли объект то, что видят посетители на публичных страницах.
+    Идеи и файлы учитываются, только если идея опубликована (или была опубликована до изменения):
+    новые заявки и построение превью для них не сбрасывают кэш.
+    """
+    if not (obj in session.new or obj in session.deleted or session.is_modified(obj)):
+        return False
+    if isinstance(obj, IdeaCategory):
+        return True
+    if isinstance(obj, Idea):
+        return _is_public_idea(session, obj)
+    if isinstance(obj, Attachment):
+        idea = session.get(Idea, obj.idea_id) if obj.idea_id is not None else obj.idea
+        return _is_public_idea(session, idea)
+    return False
+
+
+@event.listens_for(db.session, 'before_flush')
+def _bump_content_version(session, flush_context, instances):
+    """
+    Сбрасывает кэш публичных страниц при изменении идей, файлов и категорий через ORM.
+    Массовые UPDATE/DELETE в обход ORM должны вызывать bump_version сами.
+    """
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if _changes_public_content(session, obj):
+            bump_version(session.connection(), CONTENT_VERSION)
+            return
+
+
+@event.listens_for(db.session, 'before_flush')
+def _touch_ideas(session, flush_context, instances):
+    """
+    Обновляет Idea.updated_at при изменении файлов идеи (они хранятся в другой таблице).
+    Изменения полей самой идеи обновляют updated_at через onupdate. Изменения категорий
+    идеи не трогают: страница идеи учитывает их по версии реестра категорий.
+    """
+    idea_ids = set()
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, Attachment) and (obj in session.new or obj in session.deleted or session.is_modified(obj)):
+            idea_id = obj.idea_id if obj.idea_id is not None else getattr(obj.idea, 'id', None)
+            if idea_id is not None:
+                idea_ids.add(idea_id)
+
+    if idea_ids:
+        table = Idea.__table__
+        session.connection().execute(
+            table.update().where(table.c.id.in_(idea_ids)).values(updated_at=datetime.utcnow())
+        )
+
+
+class MemoryCache:
+    """LRU-кэш в памяти процесса с ограничением числа записей и временем жизни."""
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < time.monotonic():
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._items[key] = (time.monotonic() + self.ttl, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+class RedisCache:
+    """Общий для всех процессов кэш в Redis (нужен пакет redis)."""
+
+    def __init__(self, url, ttl, prefix='ideabox:page:'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('Для кэша в Redis нужен пакет redis (pip install redis)')
+
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key):
+        return self.client.get(self.prefix + key)
+
+    def set(self, key, value):
+        self.client.set(self.prefix + key, value, ex=self.ttl)
+
+    def clear(self):
+        for key in self.client.scan_iter(self.prefix + '*'):
+            self.client.delete(key)
+
+
+def get_page_cache():
+    """Кэш страниц по настройке PAGE_CACHE_BACKEND (None, если кэш выключен)."""
+    config = current_app.config
+    if config['PAGE_CACHE_BACKEND'] == 'off':
+        return None
+
+    cache = current_app.extensions.get('page_cache')
+    if cache is None:
+        if config['PAGE_CACHE_BACKEND'] == 'redis':
+            cache = RedisCache(config['PAGE_CACHE_REDIS_URL'], config['PAGE_CACHE_TTL'])
+        else:
+            cache = MemoryCache(config['PAGE_CACHE_MAX_ENTRIES'], config['PAGE_CACHE_TTL'])
+        current_app.extensions['page_cache'] = cache
+    return cache
+
+
+def _page_key():
+    """Ключ страницы: версия содержимого, путь и параметры запроса в постоянном порядке."""
+    params = urlencode(sorted(request.args.items(multi=True)))
+    return f'{get_version(CONTENT_VERSION)}:{request.path}?{params}'
+
+
+def _is_public_request():
+    """Одинакова ли страница для всех: не модератор и нет flash-сообщений."""
+    return 'moderator_id' not in session and '_flashes' not in session
+
+
+def cached_page(f):
+    """
+    Кэширует готовый HTML страницы для анонимных посетителей.
+    Модераторы и страницы с flash-сообщениями кэш не используют.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        cache = get_page_cache()
+        if cache is None or not _is_public_request():
+            return f(*args, **kwargs)
+
+        key = _page_key()
+        try:
+            body = cache.get(key)
+        except Exception as e:
+            # Недоступный общий кэш не должен ломать страницу
+            logger.warning(f"⚠️ Кэш страниц недоступен: {e}")
+            return f(*args, **kwargs)
+        if body is not None:
+            return current_app.response_class(body, mimetype='text/html')
+
+        response = make_response(f(*args, **kwargs))
+        if response.status_code == 200:
+            try:
+                cache.set(key, response.get_data())
+            except Exception as e:
+                logger.warning(f"⚠️ Не удалось сохранить страницу в кэш: {e}")
+        return response
+    return decorated_function
+
+
+def conditional_page(validators):
+    """
+    Условный GET для анонимных посетителей. validators(**kwargs) возвращает (etag, last_modified)
+    или (None, None), если страница не подходит. Если у клиента актуальная версия,
+    отвечаем 304 без обращения к представлению и рендеринга шаблона.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if not _is_public_request():
+                return f(*args, **kwargs)
+            etag, last_modified = validators(**kwargs)
+            if etag is None:
+                return f(*args, **kwargs)
+
+            if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            response.last_modified = last_modified
+            # Браузер и прокси могут хранить страницу, но перед показом должны ее проверить
+            response.cache_control.no_cache = True
+            return response
+        return decorated_function
+    return decorator
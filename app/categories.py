@@ -0,0 +1,45 @@
+from collections import namedtuple
+
+from flask import current_app
+from sqlalchemy import event, select
+
+from .cache import bump_version, get_version
+from .extensions import db
+from .models import IdeaCategory
+
+
+# Версия списка категорий (сбрасывает реестр во всех процессах)
+CATEGORIES_VERSION = 'categories'
+
+# Категория в реестре: не привязана к сессии базы данных
+CategoryEntry = namedtuple('CategoryEntry', ['id', 'name', 'description'])
+
+
+def active_categories():
+    """
+    Активные категории по названию. Хранятся в памяти процесса
+    и перечитываются из базы только после изменения версии категорий.
+    """
+    version = get_version(CATEGORIES_VERSION)
+    registry = current_app.extensions.get('category_registry')
+    if registry is None or registry[0] != version:
+        rows = db.session.execute(
+            select(IdeaCategory.id, IdeaCategory.name, IdeaCategory.description)
+            .where(IdeaCategory.is_active == True)
+            .order_by(IdeaCategory.name)
+        )
+        registry = (version, tuple(CategoryEntry(*row) for row in rows))
+        current_app.extensions['category_registry'] = registry
+    return registry[1]
+
+
+@event.listens_for(db.session, 'before_flush')
+def _bump_categories_version(session, flush_context, instances):
+    """Сбрасывает реестр категорий при их добавлении, изменении и удалении."""
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if not isinstance(obj, IdeaCategory):
+            continue
+        if obj in session.dirty and not session.is_modified(obj):
+            continue
+        bump_version(session.connection(), CATEGORIES_VERSION)
+        return
@@ -0,0 +1,185 @@
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from .attachments import backfill_attachment_metadata, collect_garbage, move_files_to_blobs
+from .counters import rebuild_counters, verify_counters
+from .exports import export_statement_counts
+from .mail_queue import process_outbox
+from .migrations import current_version, explain_hot_queries, upgrade_database
+from .notifications import send_moderator_digest
+from .previews import process_previews, queue_existing_previews
+from .search import rebuild_search_index
+from .workers import BACKGROUND_WORKERS, BackgroundWorker, start_worker
+
+
+# Команды обслуживания поискового индекса
+search_cli = AppGroup('search', help='Обслуживание поискового индекса.')
+
+
+@search_cli.command('rebuild')
+def search_rebuild():
+    """Перестраивает поисковый индекс по всем идеям."""
+    count = rebuild_search_index()
+    click.echo(f"Поисковый индекс перестроен: {count} идей")
+
+
+# Команды обслуживания счетчиков идей
+counters_cli = AppGroup('counters', help='Обслуживание счетчиков идей.')
+
+
+@counters_cli.command('rebuild')
+def counters_rebuild():
+    """Пересчитывает счетчики идей по категориям и статусам."""
+    count = rebuild_counters()
+    click.echo(f"Счетчики пересчитаны: {count} записей")
+
+
+@counters_cli.command('verify')
+def counters_verify():
+    """Проверяет счетчики на расхождение с таблицей идей."""
+    mismatches = verify_counters()
+    if not mismatches:
+        click.echo("Счетчики совпадают с данными")
+        return
+    for (category_id, status, is_published), stored, actual in mismatches:
+        click.echo(f"категория #{category_id} / {status} / опубликовано={is_published}: {stored} (счетчик) != {actual} (факт)")
+    raise SystemExit(1)
+
+
+# Команды очереди исходящих писем
+outbox_cli = AppGroup('outbox', help='Очередь исходящих писем.')
+
+
+@outbox_cli.command('drain')
+@click.option('--limit', default=500, help='Максимум писем за один запуск.')
+def outbox_drain(limit):
+    """Однократно отправляет накопившиеся письма."""
+    sent, failed = process_outbox(limit=limit)
+    click.echo(f"Отправлено: {sent}, ошибок: {failed}")
+
+
+@outbox_cli.command('digest')
+def outbox_digest():
+    """Немедленно формирует дайджест новых идей для модератора."""
+    count = send_moderator_digest(force=True)
+    click.echo(f"Идей в дайджесте: {count}")
+
+
+@outbox_cli.command('worker')
+def outbox_worker():
+    """Запускает фоновые задачи (письма, дайджест, превью) в отдельном процессе."""
+    app = current_app._get_current_object()
+    workers = dict(BACKGROUND_WORKERS)
+    # Очередь писем разбирается в основном потоке, остальные задачи - в своих
+    worker = BackgroundWorker(app, tasks=workers.pop('outbox-worker'), name='outbox-worker')
+    for name, tasks in workers.items():
+        start_worker(app, name, tasks)
+    click.echo("Обработчик очереди писем запущен (Ctrl+C для остановки)")
+    try:
+        worker.run()
+    except KeyboardInterrupt:
+        worker.stop()
+
+
+# Команды обслуживания схемы базы данных
+db_cli = AppGroup('db', help='Миграции и проверка схемы базы данных.')
+
+
+@db_cli.command('upgrade')
+def db_upgrade():
+    """Применяет новые миграции схемы."""
+    applied = upgrade_database()
+    for number, description in applied:
+        click.echo(f"Миграция {number}: {description}")
+    click.echo(f"Версия схемы: {current_version()}")
+
+
+@db_cli.command('version')
+def db_version():
+    """Показывает номер последней примененной миграции."""
+    click.echo(f"Версия схемы: {current_version()}")
+
+
+@db_cli.command('explain')
+def db_explain():
+    """Проверяет, что частые запросы к идеям используют индексы."""
+    failed = False
+    for name, plan, uses_indexes in explain_hot_queries():
+        click.echo(f"{'OK  ' if uses_indexes else 'FAIL'} {name}")
+        for line in plan:
+            click.echo(f"       {line}")
+        failed = failed or not uses_indexes
+    if failed:
+        raise SystemExit(1)
+
+
+# Команды обслуживания прикрепленных файлов
+attachments_cli = AppGroup('attachments', help='Обслуживание прикрепленных файлов.')
+
+
+@attachments_cli.command('backfill')
+@click.option('--batch-size', default=500, help='Сколько записей обрабатывать за один коммит.')
+def attachments_backfill(batch_size):
+    """Заполняет размер и MIME-тип для ранее загруженных файлов."""
+    updated, missing = backfill_attachment_metadata(batch_size=batch_size)
+    click.echo(f"Обновлено записей: {updated}, файлов не найдено: {missing}")
+
+
+@attachments_cli.command('dedupe')
+@click.option('--batch-size', default=500, help='Сколько записей обрабатывать за один коммит.')
+def attachments_dedupe(batch_size):
+    """Переносит ранее загруженные файлы в хранилище по содержимому."""
+    moved = move_files_to_blobs(batch_size=batch_size)
+    click.echo(f"Перенесено вложений: {moved}")
+
+
+@attachments_cli.command('gc')
+@click.option('--dry-run', is_flag=True, help='Только показать, что будет удалено.')
+def attachments_gc(dry_run):
+    """Удаляет файлы и превью, на которые не ссылается ни одно вложение."""
+    removed, freed = collect_garbage(dry_run=dry_run)
+    action = 'Будет удалено' if dry_run else 'Удалено'
+    click.echo(f"{action} файлов: {removed} ({freed / (1024 * 1024):.1f} MB)")
+
+
+@attachments_cli.command('previews')
+@click.option('--existing', is_flag=True, help='Поставить в очередь ранее загруженные файлы.')
+@click.option('--limit', default=100, help='Сколько превью построить за один запуск.')
+def attachments_previews(existing, limit):
+    """Строит превью изображений и PDF, ожидающих обработки."""
+    if existing:
+        click.echo(f"Поставлено в очередь: {queue_existing_previews()}")
+    processed = 0
+    while processed < limit:
+        count = process_previews(limit=min(20, limit - processed))
+        if not count:
+            break
+        processed += count
+    click.echo(f"Обработано вложений: {processed}")
+
+
+# Проверки выгрузок
+exports_cli = AppGroup('exports', help='Проверка выгрузок идей.')
+
+
+@exports_cli.command('check-queries')
+def exports_check_queries():
+    """Проверяет, что число SQL-запросов выгрузок не зависит от числа идей."""
+    failed = False
+    for name, counts in export_statement_counts().items():
+        constant = len(set(counts)) == 1
+        click.echo(f"{'OK  ' if constant else 'FAIL'} {name}: запросов {', '.join(map(str, counts))}")
+        failed = failed or not constant
+    if failed:
+        raise SystemExit(1)
+
+
+def register_commands(app):
+    """Регистрация CLI-команд приложения."""
+    app.cli.add_command(search_cli)
+    app.cli.add_command(counters_cli)
+    app.cli.add_command(outbox_cli)
+    app.cli.add_command(db_cli)
+    app.cli.add_command(attachments_cli)
+    app.cli.add_command(exports_cli)
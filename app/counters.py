@@ -0,0 +1,170 @@
+from collections import defaultdict
+
+from sqlalchemy import event, func, inspect, select
+
+from .extensions import db
+from .models import Idea, IdeaCounter
+
+
+# Поля идеи, образующие ключ счетчика
+COUNTER_FIELDS = ('category_id', 'status', 'is_published')
+
+
+def _category_id(idea):
+    """
+    Категория идеи. Если категория задана объектом через связь,
+    category_id заполнится только при flush — берем id из объекта.
+    """
+    added = inspect(idea).attrs.category.history.added
+    if added and added[0] is not None:
+        return added[0].id
+    return idea.category_id
+
+
+def _current_key(idea):
+    """Ключ счетчика по текущим значениям (с учетом значений по умолчанию)."""
+    return (
+        _category_id(idea),
+        idea.status or Idea.STATUS_PENDING,
+        bool(idea.is_published)
+    )
+
+
+def _committed_key(session, idea):
+    """Ключ счетчика по значениям, сохраненным в базе до изменения."""
+    state = inspect(idea)
+    values = []
+    for field in COUNTER_FIELDS:
+        history = state.attrs[field].history
+        if history.deleted:
+            values.append(history.deleted[0])
+        elif history.unchanged:
+            values.append(history.unchanged[0])
+        elif not history.added:
+            values.append(getattr(idea, field))
+        else:
+            # Старое значение не было загружено — читаем его из базы
+            with session.no_autoflush:
+                row = session.execute(
+                    select(Idea.category_id, Idea.status, Idea.is_published).where(Idea.id == idea.id)
+                ).one()
+            return row.category_id, row.status, bool(row.is_published)
+    return values[0], values[1], bool(values[2])
+
+
+def apply_counter_deltas(connection, deltas):
+    """Применяет изменения счетчиков: {(категория, статус, публикация): дельта}."""
+    table = IdeaCounter.__table__
+    for (category_id, status, is_published), delta in deltas.items():
+        if not delta:
+            continue
+        condition = (
+            (table.c.category_id == category_id)
+            & (table.c.status == status)
+            & (table.c.is_published == is_published)
+        )
+        result = connection.execute(
+            table.update().where(condition).values(count=table.c.count + delta)
+        )
+        if result.rowcount == 0:
+            connection.execute(table.insert().values(
+                category_id=category_id, status=status, is_published=is_published, count=delta
+            ))
+
+
+def move_category_counters(connection, from_category_id, to_category_id):
+    """Переносит счетчики идей одной категории в другую (для массового перемещения идей)."""
+    rows = connection.execute(
+        select(IdeaCounter.status, IdeaCounter.is_published, IdeaCounter.count)
+        .where(IdeaCounter.category_id == from_category_id)
+    ).all()
+    deltas = defaultdict(int)
+    for status, is_published, count in rows:
+        deltas[(from_category_id, status, bool(is_published))] -= count
+        deltas[(to_category_id, status, bool(is_published))] += count
+    apply_counter_deltas(connection, deltas)
+
+
+@event.listens_for(db.session, 'before_flush')
+def _update_counters(session, flush_context, instances):
+    """
+    Обновляет счетчики в той же транзакции, что и изменения идей.
+    Массовые UPDATE/DELETE в обход ORM должны вызывать apply_counter_deltas сами.
+    """
+    deltas = defaultdict(int)
+
+    for obj in session.new:
+        if isinstance(obj, Idea):
+            deltas[_current_key(obj)] += 1
+
+    for obj in session.deleted:
+        if isinstance(obj, Idea):
+            deltas[_committed_key(session, obj)] -= 1
+
+    for obj in session.dirty:
+        if not isinstance(obj, Idea) or obj in session.deleted:
+            continue
+        state = inspect(obj)
+        if not any(state.attrs[field].history.has_changes() for field in COUNTER_FIELDS + ('category',)):
+            continue
+        old_key, new_key = _committed_key(session, obj), _current_key(obj)
+        if old_key != new_key:
+            deltas[old_key] -= 1
+            deltas[new_key] += 1
+
+    if any(deltas.values()):
+        apply_counter_deltas(session.connection(), deltas)
+
+
+def count_ideas(category_id=None, status=None, is_published=None):
+    """Количество идей по счетчикам (без сканирования таблицы идей)."""
+    query = db.session.query(func.coalesce(func.sum(IdeaCounter.count), 0))
+    if category_id is not None:
+        query = query.filter(IdeaCounter.category_id == category_id)
+    if status is not None:
+        query = query.filter(IdeaCounter.status == status)
+    if is_published is not None:
+        query = query.filter(IdeaCounter.is_published == is_published)
+    return query.scalar()
+
+
+def _actual_counts():
+    """Фактические значения счетчиков, посчитанные по таблице идей."""
+    rows = db.session.query(
+        Idea.category_id, Idea.status, Idea.is_published, func.count(Idea.id)
+    ).group_by(Idea.category_id, Idea.status, Idea.is_published).all()
+    return {(category_id, status, bool(is_published)): count
+            for category_id, status, is_published, count in rows}
+
+
+def rebuild_counters():
+    """Пересчитывает все счетчики по таблице идей. Возвращает число записей."""
+    IdeaCounter.query.delete()
+    counts = _actual_counts()
+    for (category_id, status, is_published), count in counts.items():
+        db.session.add(IdeaCounter(
+            category_id=category_id, status=status, is_published=is_published, count=count
+        ))
+    db.session.commit()
+    return len(counts)
+
+
+def verify_counters():
+    """
+    Сверяет счетчики с таблицей идей.
+    Возвращает список расхождений (ключ, значение счетчика, фактическое значение).
+    """
+    stored = {(c.category_id, c.status, bool(c.is_published)): c.count
+              for c in IdeaCounter.query.all()}
+    actual = _actual_counts()
+    mismatches = []
+    for key in sorted(set(stored) | set(actual), key=str):
+        if stored.get(key, 0) != actual.get(key, 0):
+            mismatches.append((key, stored.get(key, 0), actual.get(key, 0)))
+    return mismatches
+
+
+def init_counters():
+    """Заполняет счетчики, если они пусты, а идеи уже есть."""
+    if not IdeaCounter.query.first() and db.session.query(Idea.id).first():
+        rebuild_counters()
@@ -0,0 +1,239 @@
+import csv
+import io
+import json
+
+from openpyxl import Workbook
+from sqlalchemy import event, func, insert
+from sqlalchemy.orm import joinedload, selectinload
+
+from .extensions import db
+from .models import Attachment, Idea, IdeaCategory
+
+
+# Размер пачки строк при потоковой выгрузке и размер отдаваемого блока
+EXPORT_BATCH_SIZE = 500
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+# Колонки CSV-выгрузки
+CSV_HEADERS = [
+    'id', 'title', 'essence', 'solution', 'description', 'author_name',
+    'contact_email', 'is_anonymous', 'category', 'status', 'is_published',
+    'moderator_feedback', 'created_at', 'attachments_count', 'attachments'
+]
+
+# Заголовки Excel-выгрузки
+XLSX_HEADERS = [
+    "ID", "Заголовок", "Проблема", "Решение", "Дополнительно",
+    "Автор", "Анонимно", "Категория", "Статус", "Дата создания",
+    "Кол-во файлов"
+]
+
+# Оптимальные ширины столбцов Excel-выгрузки (уменьшенные)
+XLSX_COLUMN_WIDTHS = {
+    'A': 6,   # ID
+    'B': 20,  # Заголовок
+    'C': 40,  # Проблема
+    'D': 40,  # Решение
+    'E': 40,  # Дополнительно
+    'F': 15,  # Автор
+    'G': 10,  # Анонимно
+    'H': 15,  # Категория
+    'I': 15,  # Статус
+    'J': 15,  # Дата создания
+    'K': 10   # Кол-во файлов
+}
+
+
+def filtered_ideas_query(status='all', category_id=None, published='all'):
+    """
+    Запрос идей с фильтрами по статусу, категории и публикации
+    (общий для главной страницы, панели модератора и выгрузок).
+    """
+    query = Idea.query
+    if status != 'all':
+        query = query.filter(Idea.status == status)
+    if published == 'published':
+        query = query.filter(Idea.is_published == True)
+    elif published == 'unpublished':
+        query = query.filter(Idea.is_published == False)
+    if category_id is not None:
+        query = query.filter(Idea.category_id == category_id)
+    return query
+
+
+def export_query(status='all', category_id=None):
+    """
+    Запрос Excel-выгрузки: идеи с категорией и количеством файлов.
+    Количество считается одним агрегирующим подзапросом, а не запросом на каждую идею.
+    """
+    attachment_counts = db.session.query(
+        Attachment.idea_id,
+        func.count(Attachment.id).label('attachments_count')
+    ).group_by(Attachment.idea_id).subquery()
+
+    return filtered_ideas_query(status, category_id).options(
+        joinedload(Idea.category)
+    ).outerjoin(
+        attachment_counts, attachment_counts.c.idea_id == Idea.id
+    ).add_columns(
+        func.coalesce(attachment_counts.c.attachments_count, 0)
+    ).order_by(Idea.created_at.desc())
+
+
+def write_xlsx(query, target):
+    """
+    Записывает Excel-выгрузку в файл (путь или файловый объект).
+    Идеи читаются пачками, книга пишется в режиме потоковой записи (строки сразу уходят на диск).
+    """
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Идеи")
+
+    # Ширины столбцов задаются до записи строк
+    for col_letter, width in XLSX_COLUMN_WIDTHS.items():
+        ws.column_dimensions[col_letter].width = width
+
+    ws.append(XLSX_HEADERS)
+    for idea, attachments_count in query.yield_per(EXPORT_BATCH_SIZE):
+        ws.append([
+            idea.id,
+            idea.title,
+            idea.essence,
+            idea.solution,
+            idea.description or "",
+            idea.author_name or "",
+            "Да" if idea.is_anonymous else "Нет",
+            idea.category.name,
+            idea.status_display(),
+            idea.created_at.strftime('%d.%m.%Y %H:%M'),
+            attachments_count
+        ])
+    wb.save(target)
+
+
+def iter_ideas(query):
+    """
+    Перебирает идеи пачками по EXPORT_BATCH_SIZE, от новых к старым (порядок индексов по дате создания).
+    Файлы подгружаются одним запросом на пачку, а не на каждую идею.
+    """
+    return query.options(
+        joinedload(Idea.category),
+        selectinload(Idea.attachments)
+    ).order_by(Idea.created_at.desc(), Idea.id.desc()).yield_per(EXPORT_BATCH_SIZE)
+
+
+def idea_to_dict(idea):
+    """Представление идеи для выгрузки, включая метаданные файлов."""
+    return {
+        'id': idea.id,
+        'title': idea.title,
+        'essence': idea.essence,
+        'solution': idea.solution,
+        'description': idea.description,
+        'author_name': idea.author_name,
+        'contact_email': idea.contact_email,
+        'is_anonymous': bool(idea.is_anonymous),
+        'category': idea.category.name,
+        'status': idea.status,
+        'is_published': bool(idea.is_published),
+        'moderator_feedback': idea.moderator_feedback,
+        'created_at': idea.created_at.isoformat() if idea.created_at else None,
+        'attachments': [
+            {'id': attachment.id, 'filename': attachment.filename, 'filepath': attachment.filepath}
+            for attachment in idea.attachments
+        ]
+    }
+
+
+def generate_csv(query):
+    """Генератор CSV-выгрузки: строки отдаются блоками по мере чтения из базы."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush():
+        value = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+        return value
+
+    writer.writerow(CSV_HEADERS)
+    yield flush()
+
+    for idea in iter_ideas(query):
+        data = idea_to_dict(idea)
+        attachments = data.pop('attachments')
+        data['attachments_count'] = len(attachments)
+        data['attachments'] = ';'.join(attachment['filename'] for attachment in attachments)
+        writer.writerow([data[header] for header in CSV_HEADERS])
+        if buffer.tell() >= EXPORT_CHUNK_SIZE:
+            yield flush()
+
+    yield flush()
+
+
+def generate_ndjson(query):
+    """Генератор выгрузки в NDJSON: одна идея — одна строка JSON."""
+    lines = []
+    size = 0
+    for idea in iter_ideas(query):
+        line = json.dumps(idea_to_dict(idea), ensure_ascii=False) + '\n'
+        lines.append(line)
+        size += len(line)
+        if size >= EXPORT_CHUNK_SIZE:
+            yield ''.join(lines)
+            lines, size = [], 0
+
+    if lines:
+        yield ''.join(lines)
+
+
+def export_statement_counts(sizes=(20, 200)):
+    """
+    Считает SQL-запросы каждой выгрузки при разном числе идей.
+    Идеи (по два файла на каждую) добавляются в транзакции, которая затем откатывается.
+    Размеры не больше EXPORT_BATCH_SIZE: каждая следующая пачка добавляет один запрос файлов.
+    Возвращает {выгрузка: [число запросов для каждого размера]}.
+    """
+    exports = {
+        'Excel': lambda: write_xlsx(export_query(), io.BytesIO()),
+        'CSV': lambda: ''.join(generate_csv(filtered_ideas_query())),
+        'NDJSON': lambda: ''.join(generate_ndjson(filtered_ideas_query())),
+    }
+    counts = {name: [] for name in exports}
+    statements = []
+
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    try:
+        category_id = db.session.execute(
+            insert(IdeaCategory).values(name='__export_check__')
+        ).inserted_primary_key[0]
+        added = 0
+        for size in sizes:
+            db.session.execute(insert(Idea), [
+                {'title': f'idea {i}', 'essence': 'essence', 'solution': 'solution',
+                 'category_id': category_id, 'status': Idea.STATUS_PENDING}
+                for i in range(added, size)
+            ])
+            idea_ids = db.session.scalars(
+                db.select(Idea.id).where(Idea.category_id == category_id).order_by(Idea.id).offset(added)
+            ).all()
+            db.session.execute(insert(Attachment), [
+                {'filename': f'{n}.pdf', 'filepath': f'export-check/{idea_id}/{n}', 'idea_id': idea_id}
+                for idea_id in idea_ids for n in range(2)
+            ])
+            added = size
+
+            for name, run in exports.items():
+                db.session.expunge_all()
+                statements.clear()
+                event.listen(db.engine, 'before_cursor_execute', count_statement)
+                try:
+                    run()
+                finally:
+                    event.remove(db.engine, 'before_cursor_execute', count_statement)
+                counts[name].append(len(statements))
+    finally:
+        db.session.rollback()
+
+    return counts
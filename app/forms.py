@@ -6,7 +6,15 @@ from wtforms import (
 )
 from wtforms.validators import DataRequired, Length, Optional, Email
 
-from .models import IdeaCategory, Idea
+from .categories import active_categories
+from .models import Idea
+
+
+def coerce_id(value):
+    """Приводит значение списка выбора к id; пустой выбор — None."""
+    if value in (None, ''):
+        return None
+    return int(value)
 
 
 class IdeaForm(FlaskForm):
@@ -101,6 +109,7 @@ class IdeaForm(FlaskForm):
     
     category = SelectField(
         'Категория',
+        coerce=coerce_id,
         validators=[DataRequired()],
         render_kw={"class": "form-select"}
     )
@@ -113,16 +122,16 @@ class IdeaForm(FlaskForm):
     def __init__(self, *args, **kwargs):
         """Инициализация формы с загрузкой категорий."""
         super(IdeaForm, self).__init__(*args, **kwargs)
-        categories = IdeaCategory.query.filter_by(is_active=True).order_by('name').all()
+        categories = active_categories()
         
         # Добавляем пустую опцию в начало списка
         category_choices = [('', '--- Выберите категорию ---')]
-        category_choices.extend([(c.name, c.name) for c in categories])
+        category_choices.extend([(c.id, c.name) for c in categories])
         
         self.category.choices = category_choices
         
         # Сохраняем описания для использования в шаблоне
-        self.category.descriptions = {c.name: c.description or '' for c in categories}
+        self.category.descriptions = {c.id: c.description or '' for c in categories}
         
         # Если нет категорий, оставляем только пустой выбор
         if not categories:
@@ -182,6 +191,7 @@ class EditIdeaForm(FlaskForm):
     
     category = SelectField(
         'Категория',
+        coerce=coerce_id,
         validators=[DataRequired()],
         render_kw={"class": "form-select"}
     )
@@ -218,8 +228,8 @@ class EditIdeaForm(FlaskForm):
     def __init__(self, *args, **kwargs):
         """Инициализация формы с загрузкой категорий."""
         super(EditIdeaForm, self).__init__(*args, **kwargs)
-        categories = IdeaCategory.query.filter_by(is_active=True).order_by('name').all()
-        self.category.choices = [(c.name, c.name) for c in categories]
+        categories = active_categories()
+        self.category.choices = [(c.id, c.name) for c in categories]
         
         # Если нет категорий, добавляем пустой выбор
         if not categories:
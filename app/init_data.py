@@ -1,5 +1,8 @@
 from .extensions import db
 from .models import IdeaCategory, Moderator
+from .counters import init_counters
+from .migrations import upgrade_database
+from .search import init_search_index
 import os
 
 
@@ -54,8 +57,10 @@ def init_database():
     """Полная инициализация базы данных."""
     print("Инициализация базы данных...")
     
-    # Создаем таблицы
-    db.create_all()
+    # Создаем таблицы и применяем миграции схемы
+    upgrade_database()
+    init_search_index()
+    init_counters()
     
     # Инициализируем данные
     init_moderators()
@@ -0,0 +1,109 @@
+import logging
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import insert
+
+from .extensions import db
+from .mailer import deliver_many
+from .models import OutboxMessage
+
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+
+def enqueue_email(recipient, subject, body_html, body_text=None):
+    """
+    Ставит письмо в очередь отправки.
+    Письмо добавляется в текущую сессию и сохраняется вместе с транзакцией вызывающего кода.
+    """
+    message = OutboxMessage(
+        recipient=recipient, subject=subject, body_html=body_html, body_text=body_text
+    )
+    db.session.add(message)
+    return message
+
+
+def enqueue_emails(messages):
+    """
+    Ставит в очередь пачку писем [(получатель, тема, html, текст)] одним INSERT.
+    Как и enqueue_email, выполняется в транзакции вызывающего кода.
+    """
+    if not messages:
+        return 0
+    db.session.execute(insert(OutboxMessage), [
+        {'recipient': recipient, 'subject': subject, 'body_html': body_html, 'body_text': body_text}
+        for recipient, subject, body_html, body_text in messages
+    ])
+    return len(messages)
+
+
+def _retry_delay(attempts):
+    """Экспоненциальная задержка перед повторной попыткой."""
+    base = current_app.config['MAIL_QUEUE_RETRY_BASE']
+    delay = base * 2 ** (attempts - 1)
+    return timedelta(seconds=min(delay, current_app.config['MAIL_QUEUE_RETRY_MAX']))
+
+
+def _claim(message_id, due_at):
+    """
+    Захватывает письмо для отправки, сдвигая время следующей попытки.
+    Если другой обработчик успел раньше, возвращает False.
+    """
+    lease = timedelta(seconds=current_app.config['MAIL_QUEUE_LEASE'])
+    claimed = OutboxMessage.query.filter(
+        OutboxMessage.id == message_id,
+        OutboxMessage.status == OutboxMessage.STATUS_PENDING,
+        OutboxMessage.next_attempt_at == due_at
+    ).update({'next_attempt_at': datetime.utcnow() + lease}, synchronize_session=False)
+    db.session.commit()
+    return claimed == 1
+
+
+def due_messages(limit):
+    """Письма, время отправки которых наступило."""
+    return OutboxMessage.query.filter(
+        OutboxMessage.status == OutboxMessage.STATUS_PENDING,
+        OutboxMessage.next_attempt_at <= datetime.utcnow()
+    ).order_by(OutboxMessage.next_attempt_at, OutboxMessage.id).limit(limit).all()
+
+
+def process_outbox(limit=50):
+    """
+    Отправляет накопившиеся письма одной пачкой через общее SMTP-соединение.
+    Возвращает кортеж (отправлено, ошибок).
+    """
+    max_attempts = current_app.config['MAIL_QUEUE_MAX_ATTEMPTS']
+    sent = failed = 0
+
+    batch = [message for message in due_messages(limit)
+             if _claim(message.id, message.next_attempt_at)]
+    if not batch:
+        return sent, failed
+
+    errors = deliver_many([
+        (message.recipient, message.subject, message.body_html, message.body_text)
+        for message in batch
+    ])
+
+    for message, error in zip(batch, errors):
+        message.attempts += 1
+        if error is not None:
+            failed += 1
+            message.last_error = str(error)
+            if message.attempts >= max_attempts:
+                message.status = OutboxMessage.STATUS_FAILED
+                logger.error(f"❌ Письмо #{message.id} на {message.recipient} не отправлено после {message.attempts} попыток: {error}")
+            else:
+                message.next_attempt_at = datetime.utcnow() + _retry_delay(message.attempts)
+                logger.warning(f"⚠️ Ошибка отправки письма #{message.id} (попытка {message.attempts}): {error}")
+        else:
+            sent += 1
+            message.status = OutboxMessage.STATUS_SENT
+            message.sent_at = datetime.utcnow()
+            message.last_error = None
+            logger.info(f"✅ Письмо #{message.id} отправлено на {message.recipient}")
+    db.session.commit()
+
+    return sent, failed
@@ -0,0 +1,163 @@
+import atexit
+import logging
+import smtplib
+import threading
+import time
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+from config import Config
+
+
+# Используем значения из класса Config
+SMTP_SERVER = Config.SMTP_SERVER
+SMTP_PORT = Config.SMTP_PORT
+SMTP_USE_TLS = Config.SMTP_USE_TLS
+SMTP_KEEPALIVE = Config.SMTP_KEEPALIVE
+FROM_EMAIL = Config.FROM_EMAIL
+EMAIL_PASSWORD = Config.EMAIL_PASSWORD
+
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+
+def build_mime_message(recipient, subject, body_html, body_text=None):
+    """Собирает MIME-сообщение из HTML-текста письма и его текстовой версии."""
+    msg = MIMEMultipart('alternative')
+    msg['Subject'] = subject
+    msg['From'] = FROM_EMAIL
+    msg['To'] = recipient
+
+    # Текстовая часть идет первой: клиенты выбирают последнюю поддерживаемую
+    if body_text:
+        msg.attach(MIMEText(body_text, 'plain', 'utf-8'))
+
+    html_part = MIMEText(body_html, 'html', 'utf-8')
+    msg.attach(html_part)
+    return msg
+
+
+class SMTPConnection:
+    """
+    Переиспользуемое авторизованное SMTP-соединение.
+    Сессия (STARTTLS + login) открывается один раз и используется для всех писем;
+    перед отправкой после простоя соединение проверяется командой NOOP.
+    """
+
+    def __init__(self, host, port, use_tls=True, username=None, password=None, keepalive=60):
+        self.host = host
+        self.port = port
+        self.use_tls = use_tls
+        self.username = username
+        self.password = password
+        self.keepalive = keepalive
+        self._server = None
+        self._last_used = 0.0
+        self._lock = threading.RLock()
+
+    def _connect(self):
+        server = smtplib.SMTP(self.host, self.port)
+        try:
+            if self.use_tls:
+                server.starttls()
+            if self.password:
+                server.login(self.username, self.password)
+        except Exception:
+            server.close()
+            raise
+        self._server = server
+        logger.info(f"🔌 SMTP-соединение с {self.host}:{self.port} установлено")
+
+    def _is_alive(self):
+        try:
+            return self._server.noop()[0] == 250
+        except OSError:
+            # В том числе SMTPException (наследник OSError)
+            return False
+
+    def _ensure_connected(self):
+        """Возвращает рабочее соединение, переподключаясь при необходимости."""
+        if self._server is not None:
+            idle = time.monotonic() - self._last_used
+            if idle > self.keepalive:
+                # Сервер, скорее всего, уже закрыл сессию по таймауту
+                self.close()
+            elif idle > 1 and not self._is_alive():
+                self.close()
+        if self._server is None:
+            self._connect()
+        return self._server
+
+    def send(self, recipient, subject, body_html, body_text=None):
+        """
+        Отправляет одно письмо. При обрыве соединения переподключается и повторяет попытку один раз;
+        отказ сервера принять письмо передается вызывающему без повтора.
+        """
+        msg = build_mime_message(recipient, subject, body_html, body_text).as_string()
+        with self._lock:
+            try:
+                self._ensure_connected().sendmail(FROM_EMAIL, recipient, msg)
+                reconnect = False
+            except smtplib.SMTPServerDisconnected:
+                reconnect = True
+            except smtplib.SMTPException:
+                # Сервер отклонил письмо (адрес, содержимое): сессия исправна, повтор решает очередь
+                raise
+            except OSError:
+                # Обрыв соединения на уровне сокета
+                reconnect = True
+            if reconnect:
+                self.close()
+                self._ensure_connected().sendmail(FROM_EMAIL, recipient, msg)
+            self._last_used = time.monotonic()
+
+    def send_many(self, messages):
+        """
+        Отправляет пачку писем [(получатель, тема, html, текст)] в одной сессии.
+        Возвращает список ошибок (None для успешно отправленных).
+        """
+        errors = []
+        with self._lock:
+            for recipient, subject, body_html, body_text in messages:
+                try:
+                    self.send(recipient, subject, body_html, body_text)
+                    errors.append(None)
+                except Exception as e:
+                    errors.append(e)
+        return errors
+
+    def close(self):
+        """Закрывает соединение."""
+        with self._lock:
+            if self._server is None:
+                return
+            try:
+                self._server.quit()
+            except OSError:
+                self._server.close()
+            finally:
+                self._server = None
+
+
+# Одно соединение на процесс
+connection = SMTPConnection(
+    SMTP_SERVER, SMTP_PORT,
+    use_tls=SMTP_USE_TLS,
+    username=FROM_EMAIL,
+    password=EMAIL_PASSWORD,
+    keepalive=SMTP_KEEPALIVE
+)
+atexit.register(connection.close)
+
+
+def deliver_email(recipient, subject, body_html, body_text=None):
+    """
+    Отправляет одно письмо через общее SMTP-соединение.
+    Ошибки не перехватываются — их обрабатывает очередь отправки.
+    """
+    connection.send(recipient, subject, body_html, body_text)
+
+
+def deliver_many(messages):
+    """Отправляет пачку писем через общее SMTP-соединение."""
+    return connection.send_many(messages)
@@ -0,0 +1,255 @@
+import logging
+from datetime import datetime
+
+from sqlalchemy import inspect, text
+
+from .extensions import db
+from .models import Idea, IdeaCounter, SchemaVersion
+
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+# Зарегистрированные миграции: (номер, описание, функция)
+MIGRATIONS = []
+
+
+def migration(version, description):
+    """
+    Регистрирует миграцию схемы.
+    Миграция получает соединение внутри транзакции и должна быть идемпотентной:
+    на новой базе, созданной db.create_all(), ей уже нечего менять.
+    """
+    def decorator(func):
+        MIGRATIONS.append((version, description, func))
+        return func
+    return decorator
+
+
+def has_column(connection, table, column):
+    """Есть ли в таблице колонка."""
+    return column in {c['name'] for c in inspect(connection).get_columns(table)}
+
+
+def create_index(connection, table, name, *columns):
+    """Создает индекс, если его еще нет."""
+    if name in {index['name'] for index in inspect(connection).get_indexes(table)}:
+        return
+    connection.execute(text(f"CREATE INDEX {name} ON {table} ({', '.join(columns)})"))
+
+
+@migration(1, 'Индекс файлов по идее')
+def _attachment_idea_index(connection):
+    create_index(connection, 'attachment', 'ix_attachment_idea_id', 'idea_id')
+
+
+@migration(2, 'Текстовая версия писем в очереди')
+def _outbox_body_text(connection):
+    if not has_column(connection, 'outbox_message', 'body_text'):
+        connection.execute(text('ALTER TABLE outbox_message ADD COLUMN body_text TEXT'))
+
+
+@migration(3, 'Составные индексы идей')
+def _idea_indexes(connection):
+    create_index(connection, 'idea', 'ix_idea_created_at', 'created_at', 'id')
+    create_index(connection, 'idea', 'ix_idea_status_created_at', 'status', 'created_at', 'id')
+    create_index(connection, 'idea', 'ix_idea_published_created_at', 'is_published', 'created_at', 'id')
+    create_index(connection, 'idea', 'ix_idea_published_status_created_at', 'is_published', 'status', 'created_at', 'id')
+    # Индексы по категории для схемы до миграции 4 (после нее их создает миграция 4)
+    if has_column(connection, 'idea', 'category'):
+        create_index(connection, 'idea', 'ix_idea_category_created_at', 'category', 'created_at', 'id')
+        create_index(connection, 'idea', 'ix_idea_published_category_created_at', 'is_published', 'category', 'created_at', 'id')
+        create_index(connection, 'idea', 'ix_idea_stats', 'created_at', 'status', 'category', 'is_published')
+
+
+@migration(4, 'Категория идеи как внешний ключ')
+def _idea_category_fk(connection):
+    if has_column(connection, 'idea', 'category'):
+        _move_idea_category_to_fk(connection)
+    create_index(connection, 'idea', 'ix_idea_category_created_at', 'category_id', 'created_at', 'id')
+    create_index(connection, 'idea', 'ix_idea_published_category_created_at', 'is_published', 'category_id', 'created_at', 'id')
+    create_index(connection, 'idea', 'ix_idea_stats', 'created_at', 'status', 'category_id', 'is_published')
+
+
+def _move_idea_category_to_fk(connection):
+    """Переносит название категории идеи в ссылку на справочник категорий."""
+    # Категории, на которые ссылаются идеи, но которых нет в справочнике
+    connection.execute(text(
+        "INSERT INTO idea_category (name, is_active) "
+        "SELECT DISTINCT category, :active FROM idea "
+        "WHERE category NOT IN (SELECT name FROM idea_category)"
+    ), {'active': True})
+
+    if not has_column(connection, 'idea', 'category_id'):
+        connection.execute(text(
+            'ALTER TABLE idea ADD COLUMN category_id INTEGER REFERENCES idea_category (id)'
+        ))
+    connection.execute(text(
+        'UPDATE idea SET category_id = '
+        '(SELECT id FROM idea_category WHERE idea_category.name = idea.category)'
+    ))
+
+    # Индексы по названию категории удаляются вместе с колонкой
+    existing = {index['name'] for index in inspect(connection).get_indexes('idea')}
+    for name in ('ix_idea_category_created_at', 'ix_idea_published_category_created_at', 'ix_idea_stats'):
+        if name in existing:
+            connection.execute(text(f'DROP INDEX {name}'))
+    connection.execute(text('ALTER TABLE idea DROP COLUMN category'))
+
+    # Счетчики теперь ведутся по id категории
+    IdeaCounter.__table__.drop(connection, checkfirst=True)
+    IdeaCounter.__table__.create(connection)
+    connection.execute(text(
+        'INSERT INTO idea_counter (category_id, status, is_published, count) '
+        'SELECT category_id, status, is_published, COUNT(id) FROM idea '
+        'GROUP BY category_id, status, is_published'
+    ))
+
+
+@migration(5, 'Размер и MIME-тип файлов')
+def _attachment_metadata(connection):
+    if not has_column(connection, 'attachment', 'size'):
+        connection.execute(text('ALTER TABLE attachment ADD COLUMN size BIGINT'))
+    if not has_column(connection, 'attachment', 'mime_type'):
+        connection.execute(text('ALTER TABLE attachment ADD COLUMN mime_type VARCHAR(100)'))
+
+
+@migration(6, 'Хеш содержимого файлов')
+def _attachment_sha256(connection):
+    if not has_column(connection, 'attachment', 'sha256'):
+        connection.execute(text('ALTER TABLE attachment ADD COLUMN sha256 VARCHAR(64)'))
+
+
+@migration(7, 'Индекс файлов по пути (подсчет ссылок на общий файл)')
+def _attachment_filepath_index(connection):
+    create_index(connection, 'attachment', 'ix_attachment_filepath', 'filepath')
+
+
+@migration(8, 'Превью файлов')
+def _attachment_previews(connection):
+    if not has_column(connection, 'attachment', 'preview_path'):
+        connection.execute(text('ALTER TABLE attachment ADD COLUMN preview_path VARCHAR(255)'))
+    if not has_column(connection, 'attachment', 'preview_state'):
+        connection.execute(text('ALTER TABLE attachment ADD COLUMN preview_state VARCHAR(20)'))
+    create_index(connection, 'attachment', 'ix_attachment_preview_state', 'preview_state')
+
+
+@migration(9, 'Версии кэшей')
+def _cache_versions(connection):
+    exists = connection.execute(text("SELECT 1 FROM cache_version WHERE name = 'content'")).first()
+    if not exists:
+        connection.execute(text("INSERT INTO cache_version (name, version) VALUES ('content', 0)"))
+
+
+@migration(10, 'Дата изменения идей и версий кэша')
+def _updated_at(connection):
+    if not has_column(connection, 'idea', 'updated_at'):
+        connection.execute(text('ALTER TABLE idea ADD COLUMN updated_at DATETIME'))
+        connection.execute(text('UPDATE idea SET updated_at = created_at'))
+    if not has_column(connection, 'cache_version', 'updated_at'):
+        connection.execute(text('ALTER TABLE cache_version ADD COLUMN updated_at DATETIME'))
+
+
+@migration(11, 'Версия реестра категорий')
+def _categories_version(connection):
+    exists = connection.execute(text("SELECT 1 FROM cache_version WHERE name = 'categories'")).first()
+    if not exists:
+        connection.execute(text("INSERT INTO cache_version (name, version) VALUES ('categories', 0)"))
+
+
+def current_version():
+    """Номер последней примененной миграции (0, если миграций не было)."""
+    # Отдельное соединение: сессия не должна держать транзакцию со старой схемой
+    with db.engine.connect() as connection:
+        return connection.execute(db.select(db.func.max(SchemaVersion.version))).scalar() or 0
+
+
+def upgrade_database():
+    """
+    Создает недостающие таблицы и применяет новые миграции по порядку.
+    Каждая миграция выполняется в своей транзакции вместе с записью о ней.
+    Возвращает список примененных миграций [(номер, описание)].
+    """
+    db.create_all()
+    version = current_version()
+    applied = []
+
+    for number, description, func in sorted(MIGRATIONS, key=lambda m: m[0]):
+        if number <= version:
+            continue
+        with db.engine.begin() as connection:
+            func(connection)
+            connection.execute(SchemaVersion.__table__.insert().values(
+                version=number, description=description, applied_at=datetime.utcnow()
+            ))
+        applied.append((number, description))
+        logger.info(f"🛠 Применена миграция {number}: {description}")
+
+    return applied
+
+
+def hot_queries():
+    """
+    Частые запросы главной страницы, панели модератора, статистики и выгрузок.
+    Запросы строятся теми же функциями, что и в маршрутах, поэтому изменение запроса
+    в маршруте попадает в проверку. Страницы списков берутся с условием курсора (не первая страница).
+    """
+    from .exports import export_query, filtered_ideas_query, iter_ideas
+    from .pagination import apply_cursor, decode_cursor, encode_cursor
+    from .search import apply_search
+    from .stats import period_stats_query
+
+    keys = [Idea.created_at, Idea.id]
+    token = decode_cursor(encode_cursor('next', [datetime.utcnow(), 0]), keys)
+
+    def page(query):
+        return apply_cursor(query, keys, True, token, per_page=6)
+
+    return {
+        'Главная: опубликованные идеи':
+            page(filtered_ideas_query(published='published')),
+        'Главная: фильтр по статусу':
+            page(filtered_ideas_query(Idea.STATUS_APPROVED, published='published')),
+        'Главная: фильтр по категории':
+            page(filtered_ideas_query(category_id=1, published='published')),
+        'Главная: поиск по дате':
+            page(apply_search(filtered_ideas_query(published='published'), 'идея')[0]),
+        'Панель модератора: все идеи':
+            page(filtered_ideas_query()),
+        'Панель модератора: фильтр по статусу':
+            page(filtered_ideas_query(Idea.STATUS_PENDING)),
+        'Панель модератора: фильтр по категории':
+            page(filtered_ideas_query(category_id=1)),
+        'Панель модератора: неопубликованные':
+            page(filtered_ideas_query(published='unpublished')),
+        'Статистика по месяцам':
+            period_stats_query('month'),
+        'Выгрузка Excel':
+            export_query(),
+        'Выгрузка Excel: фильтр по статусу':
+            export_query(Idea.STATUS_APPROVED),
+        'Выгрузка CSV: фильтр по статусу':
+            iter_ideas(filtered_ideas_query(Idea.STATUS_APPROVED)),
+    }
+
+
+def explain_hot_queries():
+    """
+    Проверяет планы частых запросов через EXPLAIN QUERY PLAN (только SQLite).
+    Возвращает список (название, план, использует ли индексы).
+    Запрос считается плохим, если таблица читается целиком без индекса
+    или сортировка выполняется во временном B-дереве.
+    """
+    if db.engine.dialect.name != 'sqlite':
+        raise RuntimeError('Проверка планов запросов поддерживается только для SQLite')
+
+    results = []
+    for name, query in hot_queries().items():
+        statement = query.statement.compile(db.engine, compile_kwargs={'literal_binds': True})
+        plan = [row[-1] for row in db.session.execute(text(f'EXPLAIN QUERY PLAN {statement}'))]
+        uses_indexes = not any(
+            (line.startswith('SCAN') and 'INDEX' not in line) or 'TEMP B-TREE FOR ORDER BY' in line
+            for line in plan
+        )
+        results.append((name, plan, uses_indexes))
+    return results
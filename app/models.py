@@ -1,10 +1,20 @@
-import os
-from flask import current_app
+from datetime import datetime
 from werkzeug.security import generate_password_hash, check_password_hash
 
 from .extensions import db
 
 
+def format_file_size(value):
+    """Форматирует размер файла в байтах в удобочитаемый вид."""
+    if not value:
+        return "0 B"
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if value < 1024.0:
+            return f"{value:.1f} {unit}"
+        value /= 1024.0
+    return f"{value:.1f} TB"
+
+
 class Idea(db.Model):
     """Модель идеи/предложения."""
     
@@ -24,8 +34,9 @@ class Idea(db.Model):
     author_name = db.Column(db.String(50))  # Имя автора
     contact_email = db.Column(db.String(120))  # Email для связи
     is_anonymous = db.Column(db.Boolean, default=False)  # Анонимная публикация
-    category = db.Column(db.String(50), default='Общее', nullable=False)  # Категория
+    category_id = db.Column(db.Integer, db.ForeignKey('idea_category.id'), nullable=False)  # Категория
     created_at = db.Column(db.DateTime, server_default=db.func.now())  # Дата создания
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)  # Дата последнего изменения (UTC)
     is_published = db.Column(db.Boolean, default=False)  # Опубликована ли идея
     moderator_feedback = db.Column(db.Text)  # Обратная связь от модератора
     status = db.Column(db.String(20), default=STATUS_PENDING, nullable=False)  # Статус идеи
@@ -37,6 +48,20 @@ class Idea(db.Model):
         cascade='all, delete-orphan',
         lazy=True
     )
+    category = db.relationship('IdeaCategory', lazy=True)
+    
+    # Индексы под фильтры и сортировки главной страницы, панели модератора и выгрузок.
+    # Набор должен совпадать с миграциями в app/migrations.py
+    __table_args__ = (
+        db.Index('ix_idea_created_at', 'created_at', 'id'),
+        db.Index('ix_idea_status_created_at', 'status', 'created_at', 'id'),
+        db.Index('ix_idea_category_created_at', 'category_id', 'created_at', 'id'),
+        db.Index('ix_idea_published_created_at', 'is_published', 'created_at', 'id'),
+        db.Index('ix_idea_published_status_created_at', 'is_published', 'status', 'created_at', 'id'),
+        db.Index('ix_idea_published_category_created_at', 'is_published', 'category_id', 'created_at', 'id'),
+        # Покрывающий индекс для помесячной статистики: агрегирование без чтения текстов идей
+        db.Index('ix_idea_stats', 'created_at', 'status', 'category_id', 'is_published'),
+    )
     
     def status_display(self):
         status_map = {
@@ -58,27 +83,18 @@ class Attachment(db.Model):
     
     id = db.Column(db.Integer, primary_key=True)
     filename = db.Column(db.String(100), nullable=False)  # Имя файла
-    filepath = db.Column(db.String(255), nullable=False)  # Путь к файлу
-    idea_id = db.Column(db.Integer, db.ForeignKey('idea.id'), nullable=False)  # Ссылка на идею
+    filepath = db.Column(db.String(255), nullable=False, index=True)  # Ключ файла в хранилище (общий для одинаковых файлов)
+    idea_id = db.Column(db.Integer, db.ForeignKey('idea.id'), nullable=False, index=True)  # Ссылка на идею
+    size = db.Column(db.BigInteger)  # Размер файла в байтах (заполняется при загрузке)
+    mime_type = db.Column(db.String(100))  # MIME-тип файла
+    sha256 = db.Column(db.String(64))  # Хеш содержимого (считается при загрузке)
+    preview_path = db.Column(db.String(255))  # Ключ превью в хранилище
+    preview_state = db.Column(db.String(20), index=True)  # Состояние превью: pending, ready, failed
     
     @property
     def file_size(self):
-        """Возвращает размер файла в удобном формате."""
-        try:
-            full_path = os.path.join(current_app.root_path, self.filepath)
-            if not os.path.exists(full_path):
-                return "0 B"
-                
-            size = os.path.getsize(full_path)
-            
-            # Форматируем размер для удобного отображения
-            for unit in ['B', 'KB', 'MB', 'GB']:
-                if size < 1024.0:
-                    return f"{size:.1f} {unit}"
-                size /= 1024.0
-            return f"{size:.1f} GB"
-        except OSError:
-            return "0 B"
+        """Возвращает размер файла в удобном формате (без обращения к диску)."""
+        return format_file_size(self.size or 0)
     
     def __repr__(self):
         return f'<Attachment {self.id}: {self.filename}>'
@@ -122,4 +138,87 @@ class IdeaCategory(db.Model):
     created_at = db.Column(db.DateTime, server_default=db.func.now())  # Дата создания
     
     def __repr__(self):
-        return f'<IdeaCategory {self.id}: {self.name}>'
\ No newline at end of file
+        return f'<IdeaCategory {self.id}: {self.name}>'
+
+class SearchTerm(db.Model):
+    """Инвертированный индекс для поиска идей (если FTS5 недоступен)."""
+    
+    term = db.Column(db.String(64), primary_key=True)  # Основа слова
+    idea_id = db.Column(db.Integer, db.ForeignKey('idea.id'), primary_key=True, index=True)  # Ссылка на идею
+    weight = db.Column(db.Float, nullable=False, default=0.0)  # Вес терма в идее
+    
+    def __repr__(self):
+        return f'<SearchTerm {self.term}: {self.idea_id}>'
+
+
+class IdeaCounter(db.Model):
+    """Счетчик идей по категории, статусу и признаку публикации."""
+    
+    category_id = db.Column(db.Integer, primary_key=True)  # Категория
+    status = db.Column(db.String(20), primary_key=True)  # Статус
+    is_published = db.Column(db.Boolean, primary_key=True)  # Опубликованы ли идеи
+    count = db.Column(db.Integer, nullable=False, default=0)  # Количество идей
+    
+    def __repr__(self):
+        return f'<IdeaCounter {self.category_id}/{self.status}/{self.is_published}: {self.count}>'
+
+
+class OutboxMessage(db.Model):
+    """Исходящее письмо в очереди на отправку."""
+    
+    # Константы статусов
+    STATUS_PENDING = 'pending'
+    STATUS_SENT = 'sent'
+    STATUS_FAILED = 'failed'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    recipient = db.Column(db.String(120), nullable=False)  # Адрес получателя
+    subject = db.Column(db.String(255), nullable=False)  # Тема письма
+    body_html = db.Column(db.Text, nullable=False)  # HTML-текст письма
+    body_text = db.Column(db.Text)  # Текстовая версия письма
+    status = db.Column(db.String(20), default=STATUS_PENDING, nullable=False)  # Статус отправки
+    attempts = db.Column(db.Integer, default=0, nullable=False)  # Количество попыток
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)  # Время следующей попытки (UTC)
+    last_error = db.Column(db.Text)  # Последняя ошибка отправки
+    created_at = db.Column(db.DateTime, server_default=db.func.now())  # Дата постановки в очередь
+    sent_at = db.Column(db.DateTime)  # Дата отправки
+    
+    __table_args__ = (
+        db.Index('ix_outbox_message_status_next_attempt', 'status', 'next_attempt_at'),
+    )
+    
+    def __repr__(self):
+        return f'<OutboxMessage {self.id}: {self.recipient} ({self.status})>'
+
+
+class DigestItem(db.Model):
+    """Новая идея, ожидающая включения в дайджест для модератора."""
+    
+    id = db.Column(db.Integer, primary_key=True)
+    idea_id = db.Column(db.Integer, nullable=False)  # Идея (без внешнего ключа: удаленные идеи пропускаются)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)  # Дата добавления (UTC)
+    
+    def __repr__(self):
+        return f'<DigestItem {self.id}: idea {self.idea_id}>'
+
+
+class CacheVersion(db.Model):
+    """Версия данных для сброса кэшей во всех процессах приложения."""
+    
+    name = db.Column(db.String(50), primary_key=True)  # Что кэшируется (например, 'content')
+    version = db.Column(db.Integer, nullable=False, default=0)  # Увеличивается при каждом изменении
+    updated_at = db.Column(db.DateTime)  # Когда версия менялась последний раз (UTC)
+    
+    def __repr__(self):
+        return f'<CacheVersion {self.name}: {self.version}>'
+
+
+class SchemaVersion(db.Model):
+    """Примененная миграция схемы базы данных."""
+    
+    version = db.Column(db.Integer, primary_key=True)  # Номер миграции
+    description = db.Column(db.String(255), nullable=False)  # Описание
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)  # Дата применения (UTC)
+    
+    def __repr__(self):
+        return f'<SchemaVersion {self.version}: {self.description}>'
@@ -0,0 +1,108 @@
+from collections import defaultdict
+
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.orm import selectinload
+
+from .cache import CONTENT_VERSION, bump_version
+from .counters import apply_counter_deltas
+from .extensions import db
+from .models import Attachment, DigestItem, Idea
+from .notifications import send_status_update_notifications
+from .search import remove_ideas
+
+
+# Массовые действия модератора
+BULK_STATUS_ACTIONS = {
+    'approve': Idea.STATUS_APPROVED,
+    'partially_approve': Idea.STATUS_PARTIALLY_APPROVED,
+    'reject': Idea.STATUS_REJECTED,
+}
+BULK_PUBLISH_ACTIONS = {
+    'publish': True,
+    'unpublish': False,
+}
+BULK_ACTIONS = (*BULK_STATUS_ACTIONS, *BULK_PUBLISH_ACTIONS, 'delete')
+
+
+def _counter_groups(condition):
+    """Группы (категория, статус, публикация) → количество для идей под условием."""
+    return db.session.execute(
+        select(Idea.category_id, Idea.status, Idea.is_published, func.count(Idea.id))
+        .where(condition)
+        .group_by(Idea.category_id, Idea.status, Idea.is_published)
+    ).all()
+
+
+def bulk_set_status(idea_ids, status):
+    """
+    Меняет статус идей одним UPDATE и ставит уведомления авторам в очередь.
+    Идеи, у которых статус уже такой, не трогаются. Возвращает число измененных идей.
+    Коммит выполняет вызывающий код.
+    """
+    condition = Idea.id.in_(idea_ids) & (Idea.status != status)
+
+    deltas = defaultdict(int)
+    for category_id, old_status, is_published, count in _counter_groups(condition):
+        deltas[(category_id, old_status, bool(is_published))] -= count
+        deltas[(category_id, status, bool(is_published))] += count
+
+    # Идеи, авторам которых уйдет уведомление (нужны для шаблона письма)
+    recipients = Idea.query.options(selectinload(Idea.category)).filter(
+        condition, Idea.contact_email.isnot(None)
+    ).all()
+
+    changed = db.session.execute(
+        update(Idea).where(condition).values(status=status),
+        execution_options={'synchronize_session': 'evaluate'}
+    ).rowcount
+    apply_counter_deltas(db.session.connection(), deltas)
+    bump_version(db.session.connection(), CONTENT_VERSION)
+
+    send_status_update_notifications(recipients, status)
+
+    return changed
+
+
+def bulk_set_published(idea_ids, is_published):
+    """Публикует или снимает с публикации идеи одним UPDATE. Возвращает число измененных идей."""
+    condition = Idea.id.in_(idea_ids) & (Idea.is_published != is_published)
+
+    deltas = defaultdict(int)
+    for category_id, status, old_published, count in _counter_groups(condition):
+        deltas[(category_id, status, bool(old_published))] -= count
+        deltas[(category_id, status, is_published)] += count
+
+    changed = db.session.execute(
+        update(Idea).where(condition).values(is_published=is_published),
+        execution_options={'synchronize_session': 'evaluate'}
+    ).rowcount
+    apply_counter_deltas(db.session.connection(), deltas)
+    bump_version(db.session.connection(), CONTENT_VERSION)
+    return changed
+
+
+def bulk_delete(idea_ids):
+    """
+    Удаляет идеи, их файлы из базы и из поискового индекса набором DELETE.
+    Возвращает (число удаленных идей, пути файлов для удаления с диска).
+    Файлы удаляются вызывающим кодом после коммита (attachments.remove_attachment_files).
+    """
+    condition = Idea.id.in_(idea_ids)
+
+    deltas = defaultdict(int)
+    for category_id, status, is_published, count in _counter_groups(condition):
+        deltas[(category_id, status, bool(is_published))] -= count
+
+    filepaths = db.session.scalars(
+        select(Attachment.filepath).where(Attachment.idea_id.in_(idea_ids))
+    ).all()
+
+    remove_ideas(idea_ids)
+    db.session.execute(delete(Attachment).where(Attachment.idea_id.in_(idea_ids)))
+    db.session.execute(delete(DigestItem).where(DigestItem.idea_id.in_(idea_ids)))
+    deleted = db.session.execute(delete(Idea).where(condition)).rowcount
+    apply_counter_deltas(db.session.connection(), deltas)
+    bump_version(db.session.connection(), CONTENT_VERSION)
+
+    return deleted, filepaths
+
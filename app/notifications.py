@@ -1,341 +1,212 @@
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+import os
+import re
+from datetime import datetime, timedelta
+from flask import current_app
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+from markupsafe import Markup, escape
 from config import Config
 import logging
 
+from .extensions import db
+from .mail_queue import enqueue_email, enqueue_emails
+from .models import DigestItem, Idea
+
 
 # Используем значения из класса Config
-SMTP_SERVER = Config.SMTP_SERVER
-SMTP_PORT = Config.SMTP_PORT
-FROM_EMAIL = Config.FROM_EMAIL
-EMAIL_PASSWORD = Config.EMAIL_PASSWORD
 MODERATOR_EMAIL = Config.MODERATOR_EMAIL
 
+# Шаблоны писем
+EMAIL_TEMPLATES_DIR = os.path.join(os.path.dirname(__file__), 'templates', 'email')
+EMAIL_TEMPLATES = ('new_idea', 'author_confirmation', 'status_update', 'moderator_digest')
+
+# Оформление письма в зависимости от нового статуса идеи
+STATUS_STYLES = {
+    'approved': {'color': '#28a745', 'icon': '✅', 'title': 'Одобрено'},
+    'partially_approved': {'color': '#20c997', 'icon': '✅', 'title': 'Одобрено (частично)'},
+    'rejected': {'color': '#dc3545', 'icon': '❌', 'title': 'Отклонено'},
+    'in_progress': {'color': '#0dcaf0', 'icon': '🔄', 'title': 'В работе'},
+    'implemented': {'color': '#6f42c1', 'icon': '🎉', 'title': 'Реализовано'}
+}
+DEFAULT_STATUS_STYLE = {'color': '#6c757d', 'icon': '📋', 'title': 'Обновлено'}
+
+_NEWLINE_RE = re.compile(r'\r\n|\r|\n')
 
 
 # Настройка логирования
 logger = logging.getLogger(__name__)
 
 def nl2br_email(text, max_length=None):
-    """Преобразует переносы строк в HTML теги <br> для email."""
+    """Экранирует текст и преобразует переносы строк в HTML теги <br> для email."""
     if not text:
         return ''
-    
+
     text = str(text)
-    
-    # Заменяем переносы строк
-    text = text.replace('\r\n', '<br>').replace('\n', '<br>').replace('\r', '<br>')
-    
+
     # Обрезаем если нужно
     if max_length and len(text) > max_length:
         text = text[:max_length] + '...'
-    
-    return text
+
+    # Заменяем переносы строк за один проход
+    return Markup(_NEWLINE_RE.sub('<br>', str(escape(text))))
+
+def preview_text(text, length):
+    """Обрезает текст до length символов для превью в письме."""
+    if not text:
+        return ''
+    text = str(text)
+    return text[:length] + '...' if len(text) > length else text
+
+
+def _create_email_environment():
+    """Создает окружение Jinja2 для писем; HTML экранируется, текст — нет."""
+    env = Environment(
+        loader=FileSystemLoader(EMAIL_TEMPLATES_DIR),
+        autoescape=select_autoescape(['html']),
+        trim_blocks=True,
+        lstrip_blocks=True,
+        auto_reload=False
+    )
+    env.filters['nl2br'] = nl2br_email
+    env.filters['preview'] = preview_text
+    return env
+
+
+# Шаблоны компилируются один раз при импорте модуля
+email_env = _create_email_environment()
+compiled_templates = {
+    name: (email_env.get_template(f'{name}.html'), email_env.get_template(f'{name}.txt'))
+    for name in EMAIL_TEMPLATES
+}
+
+
+def render_email(name, **context):
+    """Возвращает (html, текст) письма по имени шаблона."""
+    html_template, text_template = compiled_templates[name]
+    return html_template.render(**context), text_template.render(**context)
+
 
 def send_new_idea_notification(idea):
     """
-    Отправляет уведомление о новой идеи модератору.
+    Ставит в очередь уведомление о новой идее для модератора.
+    В режиме дайджеста идея откладывается до ближайшей сводной рассылки.
     """
-    server = None
-    
+    if current_app.config['MODERATOR_NOTIFY_MODE'] == 'digest':
+        db.session.add(DigestItem(idea_id=idea.id))
+        logger.info(f"🗂 Идея #{idea.id} добавлена в дайджест для модератора")
+        return True
+
     try:
-        server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT)
-        server.starttls()
-        server.login(FROM_EMAIL, EMAIL_PASSWORD)
-        
-        # Подготавливаем текст с переносами строк
-        essence_preview = nl2br_email(idea.essence[:250], max_length=250)
-        
-        html_message = f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <meta charset="utf-8">
-            <style>
-                body {{ font-family: Arial, sans-serif; line-height: 1.5; color: #333; }}
-                .container {{ max-width: 600px; margin: 0 auto; background: white; border: 1px solid #ddd; }}
-                .header {{ background: #14427a; color: white; padding: 20px; text-align: center; }}
-                .content {{ padding: 20px; }}
-                .idea-card {{ background: #f8f9fa; padding: 15px; margin: 15px 0; border-left: 4px solid #14427a; }}
-                .footer {{ text-align: center; padding: 15px; background: #f8f9fa; font-size: 12px; color: #666; }}
-                .text-content {{ white-space: pre-line; }}
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <div class="header">
-                    <h1>🚀 Новая идея в системе!</h1>
-                    <p>Лаборатория идей РОСТЕСТ</p>
-                </div>
-                
-                <div class="content">
-                    <h2>Поступила новая идея для рассмотрения</h2>
-                    
-                    <div class="idea-card">
-                        <h3 style="margin-top: 0;">{idea.title}</h3>
-                        
-                        <p><strong>📁 Категория:</strong> {idea.category}</p>
-                        <p><strong>👤 Автор:</strong> {idea.author_name or 'Аноним'}</p>
-                        <p><strong>📅 Дата подачи:</strong> {idea.created_at.strftime('%d.%m.%Y в %H:%M')}</p>
-                        <p><strong>🆔 ID идеи:</strong> #{idea.id}</p>
-                        
-                        <div style="margin: 15px 0;">
-                            <strong>💡 Суть предложения:</strong>
-                            <div class="text-content" style="background: white; padding: 10px; border-radius: 4px; margin: 8px 0;">
-                                {essence_preview}
-                            </div>
-                        </div>
-                    </div>
-                    
-                    <div style="background: #e7f3ff; padding: 15px; border-radius: 4px; border-left: 4px solid #0d6efd;">
-                        <strong>💼 Действие:</strong> Пожалуйста, зайдите в систему Лаборатории идей для рассмотрения новой идеи.
-                    </div>
-                </div>
-                
-                <div class="footer">
-                    <p><strong>Лаборатория идей РОСТЕСТ</strong></p>
-                    <p>Система автоматических уведомлений</p>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
-        
-        msg = MIMEMultipart('alternative')
-        msg['Subject'] = f"🚀 Новая идея в Лаборатории идей: #{idea.id}"
-        msg['From'] = FROM_EMAIL
-        msg['To'] = MODERATOR_EMAIL
-        
-        html_part = MIMEText(html_message, 'html', 'utf-8')
-        msg.attach(html_part)
-        
-        server.sendmail(FROM_EMAIL, MODERATOR_EMAIL, msg.as_string())
-        logger.info(f"✅ Уведомление модератору отправлено для идеи #{idea.id}")
+        html_message, text_message = render_email('new_idea', idea=idea, accent='#14427a')
+
+        enqueue_email(MODERATOR_EMAIL, f"🚀 Новая идея в Лаборатории идей: #{idea.id}", html_message, text_message)
+        logger.info(f"📨 Уведомление модератору поставлено в очередь для идеи #{idea.id}")
         return True
-        
+
     except Exception as e:
-        logger.error(f"❌ Ошибка отправки уведомления модератору: {e}")
+        logger.error(f"❌ Ошибка постановки уведомления модератору в очередь: {e}")
         return False
-        
-    finally:
-        if server:
-            server.quit()
+
 
 def send_author_confirmation(idea):
     """
-    Отправляет подтверждение автору идеи.
+    Ставит в очередь подтверждение автору идеи.
     """
     if not idea.contact_email:
         logger.info(f"📭 Email автора не указан для идеи #{idea.id}, пропускаем отправку")
         return True
-    
-    server = None
-    
+
     try:
-        server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT)
-        server.starttls()
-        server.login(FROM_EMAIL, EMAIL_PASSWORD)
-        
-        # Подготавливаем текст с переносами строк
-        essence_preview = nl2br_email(idea.essence[:300], max_length=300)
-        
-        html_message = f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <meta charset="utf-8">
-            <style>
-                body {{ font-family: Arial, sans-serif; line-height: 1.6; color: #333; }}
-                .container {{ max-width: 600px; margin: 0 auto; background: white; border: 1px solid #ddd; }}
-                .header {{ background: #28a745; color: white; padding: 25px; text-align: center; }}
-                .content {{ padding: 25px; }}
-                .idea-card {{ background: #f8f9fa; padding: 20px; margin: 20px 0; border-left: 4px solid #28a745; border-radius: 4px; }}
-                .footer {{ text-align: center; padding: 20px; background: #f8f9fa; font-size: 12px; color: #666; }}
-                .status-info {{ background: #d1ecf1; padding: 15px; border-radius: 4px; border-left: 4px solid #0dcaf0; margin: 20px 0; }}
-                .text-content {{ white-space: pre-line; }}
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <div class="header">
-                    <h1>✅ Ваша идея принята!</h1>
-                    <p>Лаборатория идей РОСТЕСТ</p>
-                </div>
-                
-                <div class="content">
-                    <h2>Спасибо за ваше предложение!</h2>
-                    <p>Ваша идея успешно получена и отправлена на модерацию.</p>
-                    
-                    <div class="idea-card">
-                        <h3 style="margin-top: 0; color: #28a745;">{idea.title}</h3>
-                        
-                        <p><strong>📁 Категория:</strong> {idea.category}</p>
-                        <p><strong>👤 Автор:</strong> {idea.author_name or 'Не указано'}</p>
-                        <p><strong>📅 Дата подачи:</strong> {idea.created_at.strftime('%d.%m.%Y в %H:%M')}</p>
-                        <p><strong>🆔 Номер заявки:</strong> <strong>#{idea.id}</strong></p>
-                        
-                        <div style="margin: 15px 0;">
-                            <strong>💡 Ваше предложение:</strong>
-                            <div class="text-content" style="background: white; padding: 12px; border-radius: 4px; margin: 10px 0;">
-                                {essence_preview}
-                            </div>
-                        </div>
-                    </div>
-                    
-                    <div class="status-info">
-                        <h4 style="margin-top: 0;">📋 Что дальше?</h4>
-                        <ul style="margin-bottom: 0;">
-                            <li>Ваша идея будет рассмотрена модератором в ближайшее время</li>
-                            <li>При необходимости с вами свяжутся для уточнения деталей</li>
-                            <li>Вы получите уведомление об изменении статуса идеи</li>
-                        </ul>
-                    </div>
-                    
-                    <div style="background: #fff3cd; padding: 15px; border-radius: 4px; border-left: 4px solid #ffc107;">
-                        <strong>💡 Сохраните номер заявки:</strong> #{idea.id} - он может понадобиться для обращения в поддержку.
-                    </div>
-                </div>
-                
-                <div class="footer">
-                    <p><strong>Лаборатория идей РОСТЕСТ</strong></p>
-                    <p>Система автоматических уведомлений</p>
-                    <p><small>Это письмо отправлено автоматически, пожалуйста, не отвечайте на него.</small></p>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
-        
-        msg = MIMEMultipart('alternative')
-        msg['Subject'] = f"✅ Ваша идея принята: #{idea.id}"
-        msg['From'] = FROM_EMAIL
-        msg['To'] = idea.contact_email
-        
-        html_part = MIMEText(html_message, 'html', 'utf-8')
-        msg.attach(html_part)
-        
-        server.sendmail(FROM_EMAIL, idea.contact_email, msg.as_string())
-        logger.info(f"✅ Подтверждение автору отправлено для идеи #{idea.id} на {idea.contact_email}")
+        html_message, text_message = render_email('author_confirmation', idea=idea, accent='#28a745')
+
+        enqueue_email(idea.contact_email, f"✅ Ваша идея принята: #{idea.id}", html_message, text_message)
+        logger.info(f"📨 Подтверждение автору поставлено в очередь для идеи #{idea.id} на {idea.contact_email}")
         return True
-        
+
     except Exception as e:
-        logger.error(f"❌ Ошибка отправки подтверждения автору: {e}")
+        logger.error(f"❌ Ошибка постановки подтверждения автору в очередь: {e}")
         return False
-        
-    finally:
-        if server:
-            server.quit()
+
+
+def build_status_update_email(idea, new_status):
+    """Письмо автору об изменении статуса: (получатель, тема, html, текст)."""
+    # Определяем цвет и иконку в зависимости от статуса
+    status = STATUS_STYLES.get(new_status, DEFAULT_STATUS_STYLE)
+    html_message, text_message = render_email(
+        'status_update', idea=idea, status=status, accent=status['color']
+    )
+    subject = f"{status['icon']} Статус идеи #{idea.id} изменен: {status['title']}"
+    return idea.contact_email, subject, html_message, text_message
+
 
 def send_status_update_notification(idea, old_status, new_status):
     """
-    Отправляет уведомление автору об изменении статуса идеи.
+    Ставит в очередь уведомление автору об изменении статуса идеи.
     """
     if not idea.contact_email:
         logger.info(f"📭 Email автора не указан для идеи #{idea.id}, пропускаем отправку статуса")
         return True
-    
-    server = None
-    
+
     try:
-        server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT)
-        server.starttls()
-        server.login(FROM_EMAIL, EMAIL_PASSWORD)
-        
-        # Определяем цвет и иконку в зависимости от статуса
-        status_config = {
-            'approved': {'color': '#28a745', 'icon': '✅', 'title': 'Одобрено'},
-            'partially_approved': {'color': '#20c997', 'icon': '✅', 'title': 'Одобрено (частично)'},
-            'rejected': {'color': '#dc3545', 'icon': '❌', 'title': 'Отклонено'}, 
-            'in_progress': {'color': '#0dcaf0', 'icon': '🔄', 'title': 'В работе'},
-            'implemented': {'color': '#6f42c1', 'icon': '🎉', 'title': 'Реализовано'}
-        }
-        
-        config = status_config.get(new_status, {'color': '#6c757d', 'icon': '📋', 'title': 'Обновлено'})
-        
-        # Подготавливаем комментарий модератора с переносами строк
-        moderator_feedback_html = ''
-        if idea.moderator_feedback:
-            feedback_text = nl2br_email(idea.moderator_feedback)
-            moderator_feedback_html = f"""
-            <div style="margin: 15px 0;">
-                <strong>💬 Комментарий модератора:</strong>
-                <div class="text-content" style="background: white; padding: 10px; border-radius: 4px; margin: 8px 0;">
-                    {feedback_text}
-                </div>
-            </div>
-            """
-        
-        html_message = f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <meta charset="utf-8">
-            <style>
-                body {{ font-family: Arial, sans-serif; line-height: 1.6; color: #333; }}
-                .container {{ max-width: 600px; margin: 0 auto; background: white; border: 1px solid #ddd; }}
-                .header {{ background: {config['color']}; color: white; padding: 25px; text-align: center; }}
-                .content {{ padding: 25px; }}
-                .idea-card {{ background: #f8f9fa; padding: 20px; margin: 20px 0; border-left: 4px solid {config['color']}; }}
-                .footer {{ text-align: center; padding: 20px; background: #f8f9fa; font-size: 12px; color: #666; }}
-                .status-change {{ background: #e7f3ff; padding: 15px; border-radius: 4px; margin: 20px 0; }}
-                .text-content {{ white-space: pre-line; }}
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <div class="header">
-                    <h1>{config['icon']} Статус вашей идеи изменен</h1>
-                    <p>Лаборатория идей РОСТЕСТ</p>
-                </div>
-                
-                <div class="content">
-                    <h2>Статус вашей идеи обновлен</h2>
-                    
-                    <div class="status-change">
-                        <p><strong>Идея:</strong> "{idea.title}"</p>
-                        <p><strong>Новый статус:</strong> <span style="color: {config['color']}; font-weight: bold;">{config['title']}</span></p>
-                        <p><strong>Номер заявки:</strong> #{idea.id}</p>
-                    </div>
-                    
-                    <div class="idea-card">
-                        <h4 style="margin-top: 0;">📋 Детали идеи:</h4>
-                        <p><strong>Категория:</strong> {idea.category}</p>
-                        <p><strong>Дата подачи:</strong> {idea.created_at.strftime('%d.%m.%Y')}</p>
-                        
-                        {moderator_feedback_html}
-                    </div>
-                    
-                    <div style="background: #f8f9fa; padding: 15px; border-radius: 4px;">
-                        <p><strong>📞 Обратная связь:</strong> Если у вас есть вопросы, вы можете обратиться к модераторам системы.</p>
-                    </div>
-                </div>
-                
-                <div class="footer">
-                    <p><strong>Лаборатория идей РОСТЕСТ</strong></p>
-                    <p>Система автоматических уведомлений</p>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
-        
-        msg = MIMEMultipart('alternative')
-        msg['Subject'] = f"{config['icon']} Статус идеи #{idea.id} изменен: {config['title']}"
-        msg['From'] = FROM_EMAIL
-        msg['To'] = idea.contact_email
-        
-        html_part = MIMEText(html_message, 'html', 'utf-8')
-        msg.attach(html_part)
-        
-        server.sendmail(FROM_EMAIL, idea.contact_email, msg.as_string())
-        logger.info(f"✅ Уведомление о статусе отправлено автору идеи #{idea.id}")
+        enqueue_email(*build_status_update_email(idea, new_status))
+        logger.info(f"📨 Уведомление о статусе поставлено в очередь автору идеи #{idea.id}")
         return True
-        
+
     except Exception as e:
-        logger.error(f"❌ Ошибка отправки уведомления о статусе: {e}")
+        logger.error(f"❌ Ошибка постановки уведомления о статусе в очередь: {e}")
         return False
-        
-    finally:
-        if server:
-            server.quit()
\ No newline at end of file
+
+
+def send_status_update_notifications(ideas, new_status):
+    """
+    Ставит в очередь уведомления о смене статуса для нескольких идей одним INSERT.
+    Возвращает количество поставленных в очередь писем.
+    """
+    messages = [build_status_update_email(idea, new_status) for idea in ideas if idea.contact_email]
+    count = enqueue_emails(messages)
+    logger.info(f"📨 Уведомления о статусе поставлены в очередь: {count}")
+    return count
+
+
+def send_moderator_digest(force=False):
+    """
+    Собирает накопившиеся новые идеи в одно письмо модератору.
+    Письмо формируется, когда самой старой идее в дайджесте больше
+    MODERATOR_DIGEST_INTERVAL секунд (или сразу, если force=True).
+    Возвращает количество идей в отправленном дайджесте.
+    """
+    oldest = db.session.query(db.func.min(DigestItem.created_at)).scalar()
+    if oldest is None:
+        return 0
+
+    window = timedelta(seconds=current_app.config['MODERATOR_DIGEST_INTERVAL'])
+    if not force and datetime.utcnow() - oldest < window:
+        return 0
+
+    items = DigestItem.query.order_by(DigestItem.id).all()
+    item_ids = [item.id for item in items]
+    ideas = Idea.query.filter(
+        Idea.id.in_([item.idea_id for item in items])
+    ).order_by(Idea.created_at, Idea.id).all()
+
+    # Забираем элементы дайджеста; если их уже забрал другой обработчик, выходим
+    claimed = DigestItem.query.filter(DigestItem.id.in_(item_ids)).delete(synchronize_session=False)
+    if claimed != len(item_ids):
+        db.session.rollback()
+        return 0
+
+    if not ideas:
+        db.session.commit()
+        return 0
+
+    try:
+        html_message, text_message = render_email('moderator_digest', ideas=ideas, accent='#14427a')
+
+        enqueue_email(MODERATOR_EMAIL, f"🚀 Новые идеи в Лаборатории идей: {len(ideas)}", html_message, text_message)
+        db.session.commit()
+        logger.info(f"📨 Дайджест модератору поставлен в очередь: {len(ideas)} идей")
+        return len(ideas)
+
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"❌ Ошибка формирования дайджеста модератору: {e}")
+        return 0
@@ -0,0 +1,135 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from sqlalchemy import and_, literal, or_
+
+from .extensions import db
+
+
+class CursorPage:
+    """
+    Страница курсорной пагинации.
+    Вместо номера страницы хранит непрозрачные токены соседних страниц.
+    """
+
+    cursor_based = True
+
+    def __init__(self, items, per_page, next_cursor=None, prev_cursor=None, total=None):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.total = total  # None, если подсчет отключен
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+
+def _dump_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ')
+    return value
+
+
+def encode_cursor(direction, values):
+    """Упаковывает направление и значения ключа сортировки в токен для URL."""
+    payload = json.dumps({'d': direction, 'k': [_dump_value(v) for v in values]}, ensure_ascii=False)
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token, keys):
+    """
+    Распаковывает токен курсора. Возвращает (направление, значения)
+    или None, если токен поврежден или не подходит к текущей сортировке.
+    """
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        payload = json.loads(raw.decode('utf-8'))
+        direction, values = payload['d'], payload['k']
+        if direction not in ('next', 'prev') or len(values) != len(keys):
+            return None
+        return direction, [_load_value(key, value) for key, value in zip(keys, values)]
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError, KeyError):
+        return None
+
+
+def _load_value(key, value):
+    if value is None or not isinstance(key.type, db.DateTime):
+        return value
+    # SQLite хранит CURRENT_TIMESTAMP строкой 'YYYY-MM-DD HH:MM:SS', а SQLAlchemy
+    # передает datetime с микросекундами: строки сравнивались бы неверно,
+    # поэтому для SQLite дата подставляется в том виде, в каком хранится
+    if db.engine.dialect.name == 'sqlite':
+        return literal(datetime.fromisoformat(value).isoformat(sep=' '), db.String)
+    return datetime.fromisoformat(value)
+
+
+def _seek_condition(keys, values, descending):
+    """
+    Условие «строго после значений ключа» для составного ключа сортировки:
+    k1 > v1 OR (k1 = v1 AND k2 > v2) ... (или < при убывании).
+    """
+    key, value = keys[0], values[0]
+    after = key < value if descending else key > value
+    if len(keys) == 1:
+        return after
+    return or_(after, and_(key == value, _seek_condition(keys[1:], values[1:], descending)))
+
+
+def apply_cursor(query, keys, descending, token, per_page):
+    """
+    Запрос одной страницы курсорной пагинации: условие по ключу, сортировка и лимит
+    (на одну строку больше страницы, чтобы узнать, есть ли следующая).
+    token — результат decode_cursor или None для первой страницы. К строкам добавляются значения ключа.
+    """
+    backwards = token is not None and token[0] == 'prev'
+
+    # Назад идем в обратном порядке и переворачиваем результат
+    order_descending = descending != backwards
+    if token is not None:
+        query = query.filter(_seek_condition(keys, token[1], order_descending))
+
+    order = [key.desc() if order_descending else key.asc() for key in keys]
+    return query.add_columns(*keys).order_by(*order).limit(per_page + 1)
+
+
+def cursor_paginate(query, keys, descending=True, cursor=None, per_page=6, count_total=True):
+    """
+    Курсорная (keyset) пагинация запроса.
+    keys — выражения сортировки, последнее должно быть уникальным (обычно Idea.id).
+    Страница выбирается условием по ключу вместо OFFSET, поэтому
+    глубокие страницы обходятся так же дешево, как первая.
+    """
+    total = query.order_by(None).count() if count_total else None
+
+    token = decode_cursor(cursor, keys)
+    backwards = token is not None and token[0] == 'prev'
+    rows = apply_cursor(query, keys, descending, token, per_page).all()
+
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+
+    items = [row[0] for row in rows]
+    if not rows:
+        return CursorPage(items, per_page, total=total)
+
+    has_next = True if backwards else has_more
+    has_prev = has_more if backwards else token is not None
+    return CursorPage(
+        items,
+        per_page,
+        next_cursor=encode_cursor('next', rows[-1][1:]) if has_next else None,
+        prev_cursor=encode_cursor('prev', rows[0][1:]) if has_prev else None,
+        total=total
+    )
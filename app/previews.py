@@ -0,0 +1,174 @@
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+from flask import abort, current_app, redirect, request
+from werkzeug.utils import send_file
+
+from .attachments import PREVIEW_FOLDER, attachment_storage, upload_folder
+from .extensions import db
+from .models import Attachment
+from .storage import LocalStorage, get_storage
+
+
+# Состояния превью вложения
+PREVIEW_PENDING = 'pending'
+PREVIEW_READY = 'ready'
+PREVIEW_FAILED = 'failed'
+
+# Типы файлов, для которых строится превью
+IMAGE_TYPES = {'image/jpeg', 'image/png'}
+PREVIEW_TYPES = IMAGE_TYPES | {'application/pdf'}
+
+# Сколько секунд ждать построения одного превью
+PREVIEW_TIMEOUT = 60
+
+# Превью по хешу содержимого не меняется - кэшируем на год
+PREVIEW_MAX_AGE = 365 * 24 * 3600
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+
+def needs_preview(mime_type):
+    """Строится ли превью для файла такого типа."""
+    return mime_type in PREVIEW_TYPES
+
+
+def preview_key(sha256):
+    """Ключ превью в хранилище (одинаковые файлы имеют общее превью)."""
+    return os.path.join(current_app.config['UPLOAD_FOLDER'], PREVIEW_FOLDER, sha256[:2], sha256[2:4], f'{sha256}.jpg')
+
+
+def render_preview(source_path, mime_type, target_path, size):
+    """
+    Рисует JPEG-превью файла. Выполняется в отдельном процессе:
+    изображения уменьшаются через Pillow, у PDF берется первая страница (pdftoppm из poppler-utils).
+    """
+    if mime_type == 'application/pdf':
+        # pdftoppm сам добавляет расширение .jpg к имени
+        subprocess.run(
+            ['pdftoppm', '-jpeg', '-singlefile', '-f', '1', '-l', '1', '-scale-to', str(size),
+             source_path, target_path[:-len('.jpg')]],
+            check=True, capture_output=True, timeout=PREVIEW_TIMEOUT
+        )
+        return
+
+    from PIL import Image
+
+    with Image.open(source_path) as image:
+        # Для JPEG декодируем сразу в уменьшенном масштабе
+        image.draft('RGB', (size, size))
+        image.thumbnail((size, size))
+        image.convert('RGB').save(target_path, 'JPEG', quality=80, optimize=True)
+
+
+def _pool():
+    """Пул процессов для построения превью (один на приложение)."""
+    pool = current_app.extensions.get('preview_pool')
+    if pool is None:
+        pool = ProcessPoolExecutor(max_workers=current_app.config['PREVIEW_WORKERS'])
+        current_app.extensions['preview_pool'] = pool
+    return pool
+
+
+def _temp_file(suffix=''):
+    fd, path = tempfile.mkstemp(dir=upload_folder(), prefix='.upload-', suffix=suffix)
+    os.close(fd)
+    return path
+
+
+def process_previews(limit=20):
+    """
+    Строит превью для вложений, ожидающих обработки. Файлы обрабатываются параллельно
+    в пуле процессов, поток-обработчик только ждет результатов. Возвращает число обработанных вложений.
+    """
+    attachments = Attachment.query.filter_by(preview_state=PREVIEW_PENDING).order_by(Attachment.id).limit(limit).all()
+    if not attachments:
+        return 0
+
+    storage = get_storage()
+    size = current_app.config['PREVIEW_SIZE']
+    jobs = []
+    temp_paths = []
+    try:
+        for attachment in attachments:
+            key = preview_key(attachment.sha256)
+            if storage.exists(key):
+                # Превью такого же файла уже построено
+                attachment.preview_path = key
+                attachment.preview_state = PREVIEW_READY
+                continue
+
+            source_storage = attachment_storage(attachment.filepath)
+            try:
+                if isinstance(source_storage, LocalStorage):
+                    source = source_storage.path(attachment.filepath)
+                else:
+                    source = _temp_file()
+                    temp_paths.append(source)
+                    with source_storage.open(attachment.filepath) as stream, open(source, 'wb') as f:
+                        shutil.copyfileobj(stream, f)
+            except Exception as e:
+                attachment.preview_state = PREVIEW_FAILED
+                logger.warning(f"⚠️ Нет файла для превью вложения {attachment.id}: {e}")
+                continue
+
+            target = _temp_file('.jpg')
+            temp_paths.append(target)
+            future = _pool().submit(render_preview, source, attachment.mime_type, target, size)
+            jobs.append((attachment, key, target, future))
+
+        for attachment, key, target, future in jobs:
+            try:
+                future.result(timeout=PREVIEW_TIMEOUT)
+                storage.store(key, target, 'image/jpeg')
+                attachment.preview_path = key
+                attachment.preview_state = PREVIEW_READY
+            except Exception as e:
+                attachment.preview_state = PREVIEW_FAILED
+                logger.warning(f"⚠️ Не удалось построить превью вложения {attachment.id}: {e}")
+    finally:
+        for path in temp_paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+    db.session.commit()
+    return len(attachments)
+
+
+def queue_existing_previews():
+    """Ставит в очередь превью для ранее загруженных файлов. Возвращает число вложений."""
+    queued = Attachment.query.filter(
+        Attachment.preview_state.is_(None),
+        Attachment.sha256.isnot(None),
+        Attachment.mime_type.in_(PREVIEW_TYPES)
+    ).update({Attachment.preview_state: PREVIEW_PENDING}, synchronize_session=False)
+    db.session.commit()
+    return queued
+
+
+def send_preview(attachment):
+    """Ответ с превью вложения с долгим кэшированием (превью привязано к хешу содержимого)."""
+    storage = get_storage()
+    url = storage.url(attachment.preview_path, content_type='image/jpeg')
+    if url:
+        return redirect(url)
+
+    path = storage.path(attachment.preview_path)
+    if not os.path.exists(path):
+        abort(404)
+
+    response = send_file(
+        path,
+        request.environ,
+        mimetype='image/jpeg',
+        etag=attachment.sha256,
+        max_age=PREVIEW_MAX_AGE,
+        response_class=current_app.response_class
+    )
+    response.cache_control.immutable = True
+    return response
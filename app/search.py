@@ -0,0 +1,315 @@
+import re
+from collections import Counter
+
+from flask import current_app
+from sqlalchemy import bindparam, func, text
+
+from .extensions import db
+from .models import Idea, SearchTerm
+
+
+# Веса полей идеи при ранжировании: совпадение в заголовке важнее
+FIELD_WEIGHTS = {
+    'title': 10.0,
+    'essence': 1.0,
+    'solution': 1.0,
+    'description': 1.0,
+}
+
+FTS_TABLE = 'idea_search'
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+_CYRILLIC_RE = re.compile(r'[а-я]')
+
+
+# Стеммер для русского языка (алгоритм Snowball, Портер)
+_VOWELS = 'аеиоуыэюя'
+
+_PERFECTIVE_GERUND_1 = ('вшись', 'вши', 'в')
+_PERFECTIVE_GERUND_2 = ('ившись', 'ывшись', 'ивши', 'ывши', 'ив', 'ыв')
+_ADJECTIVE = (
+    'ими', 'ыми', 'его', 'ого', 'ему', 'ому', 'ее', 'ие', 'ые', 'ое', 'ей',
+    'ий', 'ый', 'ой', 'ем', 'им', 'ым', 'ом', 'их', 'ых', 'ую', 'юю', 'ая',
+    'яя', 'ою', 'ею'
+)
+_PARTICIPLE_1 = ('ем', 'нн', 'вш', 'ющ', 'щ')
+_PARTICIPLE_2 = ('ивш', 'ывш', 'ующ')
+_REFLEXIVE = ('ся', 'сь')
+_VERB_1 = (
+    'ла', 'на', 'ете', 'йте', 'ли', 'й', 'л', 'ем', 'н', 'ло', 'но', 'ет',
+    'ют', 'ны', 'ть', 'ешь', 'нно'
+)
+_VERB_2 = (
+    'ила', 'ыла', 'ена', 'ейте', 'уйте', 'ите', 'или', 'ыли', 'ей', 'уй',
+    'ил', 'ыл', 'им', 'ым', 'ен', 'ило', 'ыло', 'ено', 'ят', 'ует', 'уют',
+    'ит', 'ыт', 'ены', 'ить', 'ыть', 'ишь', 'ую', 'ю'
+)
+_NOUN = (
+    'иями', 'ями', 'ами', 'ией', 'иям', 'ием', 'иях', 'ев', 'ов', 'ие', 'ье',
+    'еи', 'ии', 'ей', 'ой', 'ий', 'ям', 'ем', 'ам', 'ом', 'ах', 'ях', 'ию',
+    'ью', 'ия', 'ья', 'а', 'е', 'и', 'й', 'о', 'у', 'ы', 'ь', 'ю', 'я'
+)
+_SUPERLATIVE = ('ейше', 'ейш')
+_DERIVATIONAL = ('ость', 'ост')
+
+
+def _regions(word):
+    """Возвращает начала областей RV и R2 слова."""
+    rv = len(word)
+    for i, char in enumerate(word):
+        if char in _VOWELS:
+            rv = i + 1
+            break
+
+    def next_region(start):
+        for i in range(start + 1, len(word)):
+            if word[i] not in _VOWELS and word[i - 1] in _VOWELS:
+                return i + 1
+        return len(word)
+
+    r1 = next_region(0)
+    r2 = next_region(r1)
+    return rv, r2
+
+
+def _remove_ending(word, start, endings, preceded_by=None):
+    """
+    Удаляет самое длинное окончание из endings, целиком лежащее в области,
+    начинающейся с позиции start. Возвращает новое слово или None.
+    """
+    for ending in sorted(endings, key=len, reverse=True):
+        if not word.endswith(ending) or len(word) - len(ending) < start:
+            continue
+        stem = word[:-len(ending)]
+        if preceded_by:
+            if len(stem) <= start or stem[-1] not in preceded_by:
+                continue
+        return stem
+    return None
+
+
+def _remove_grouped(word, start, group_1, group_2):
+    """Удаляет окончание групп 1 (после «а»/«я») и 2 (без условий)."""
+    candidates = []
+    stem = _remove_ending(word, start, group_1, preceded_by='ая')
+    if stem is not None:
+        candidates.append(stem)
+    stem = _remove_ending(word, start, group_2)
+    if stem is not None:
+        candidates.append(stem)
+    if not candidates:
+        return None
+    # Побеждает самое длинное окончание, то есть самая короткая основа
+    return min(candidates, key=len)
+
+
+def stem_russian(word):
+    """Возвращает основу русского слова."""
+    word = word.replace('ё', 'е')
+    rv, r2 = _regions(word)
+
+    # Шаг 1: деепричастия, возвратные частицы, прилагательные, глаголы, существительные
+    stem = _remove_grouped(word, rv, _PERFECTIVE_GERUND_1, _PERFECTIVE_GERUND_2)
+    if stem is not None:
+        word = stem
+    else:
+        stem = _remove_ending(word, rv, _REFLEXIVE)
+        if stem is not None:
+            word = stem
+
+        stem = _remove_ending(word, rv, _ADJECTIVE)
+        if stem is not None:
+            participle = _remove_grouped(stem, rv, _PARTICIPLE_1, _PARTICIPLE_2)
+            word = participle if participle is not None else stem
+        else:
+            stem = _remove_grouped(word, rv, _VERB_1, _VERB_2)
+            if stem is None:
+                stem = _remove_ending(word, rv, _NOUN)
+            if stem is not None:
+                word = stem
+
+    # Шаг 2: окончание «и»
+    if word.endswith('и') and len(word) - 1 >= rv:
+        word = word[:-1]
+
+    # Шаг 3: словообразовательные суффиксы в R2
+    stem = _remove_ending(word, r2, _DERIVATIONAL)
+    if stem is not None:
+        word = stem
+
+    # Шаг 4: превосходная степень, удвоенная «н», мягкий знак
+    stem = _remove_ending(word, rv, _SUPERLATIVE)
+    if stem is not None:
+        word = stem
+    if word.endswith('нн') and len(word) - 2 >= rv:
+        word = word[:-1]
+    elif word.endswith('ь') and len(word) - 1 >= rv:
+        word = word[:-1]
+
+    return word
+
+
+def tokenize(value):
+    """Разбивает текст на нормализованные (приведенные к основе) термы."""
+    if not value:
+        return []
+    terms = []
+    for token in _TOKEN_RE.findall(str(value).lower().replace('ё', 'е')):
+        if _CYRILLIC_RE.search(token):
+            token = stem_russian(token)
+        if token:
+            terms.append(token[:64])
+    return terms
+
+
+# Выбор поискового движка
+def _backend():
+    """
+    Определяет движок поиска: FTS5 для SQLite (если таблица создана)
+    или переносимый инвертированный индекс в таблице search_term.
+    """
+    backend = current_app.extensions.get('search_backend')
+    if backend:
+        return backend
+
+    backend = 'index'
+    configured = current_app.config.get('SEARCH_BACKEND', 'auto')
+    if configured in ('auto', 'fts5') and db.engine.dialect.name == 'sqlite':
+        exists = db.session.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {'name': FTS_TABLE}
+        ).first()
+        if exists:
+            backend = 'fts5'
+
+    current_app.extensions['search_backend'] = backend
+    return backend
+
+
+def init_search_index():
+    """Создает таблицу FTS5 (для SQLite) и заполняет индекс, если он пуст."""
+    current_app.extensions.pop('search_backend', None)
+    configured = current_app.config.get('SEARCH_BACKEND', 'auto')
+
+    if configured in ('auto', 'fts5') and db.engine.dialect.name == 'sqlite':
+        try:
+            db.session.execute(text(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+                f"USING fts5(title, body, tokenize='unicode61', prefix='2 3')"
+            ))
+            db.session.commit()
+        except Exception as e:
+            # Сборка SQLite без FTS5 — используем переносимый индекс
+            db.session.rollback()
+            current_app.logger.warning(f"FTS5 недоступен, используется инвертированный индекс: {e}")
+
+    if _backend() == 'fts5':
+        indexed = db.session.execute(text(f"SELECT count(*) FROM {FTS_TABLE}")).scalar()
+    else:
+        indexed = db.session.query(func.count(func.distinct(SearchTerm.idea_id))).scalar()
+
+    if not indexed and db.session.query(Idea.id).first():
+        rebuild_search_index()
+
+
+def rebuild_search_index():
+    """Полностью перестраивает поисковый индекс. Возвращает число идей."""
+    if _backend() == 'fts5':
+        db.session.execute(text(f"DELETE FROM {FTS_TABLE}"))
+    else:
+        SearchTerm.query.delete()
+
+    count = 0
+    for idea in Idea.query.order_by(Idea.id).yield_per(500):
+        index_idea(idea, replace=False)
+        count += 1
+    db.session.commit()
+    return count
+
+
+# Синхронизация индекса (вызывается в той же транзакции, что и изменение идеи)
+def index_idea(idea, replace=True):
+    """Добавляет или обновляет идею в поисковом индексе."""
+    if replace:
+        remove_idea(idea.id)
+
+    fields = {name: tokenize(getattr(idea, name)) for name in FIELD_WEIGHTS}
+
+    if _backend() == 'fts5':
+        body = ' '.join(
+            ' '.join(fields[name]) for name in FIELD_WEIGHTS if name != 'title'
+        )
+        db.session.execute(
+            text(f"INSERT INTO {FTS_TABLE} (rowid, title, body) VALUES (:id, :title, :body)"),
+            {'id': idea.id, 'title': ' '.join(fields['title']), 'body': body}
+        )
+        return
+
+    weights = Counter()
+    for name, terms in fields.items():
+        for term in terms:
+            weights[term] += FIELD_WEIGHTS[name]
+    if weights:
+        db.session.execute(
+            SearchTerm.__table__.insert(),
+            [{'term': term, 'idea_id': idea.id, 'weight': weight}
+             for term, weight in weights.items()]
+        )
+
+
+def remove_idea(idea_id):
+    """Удаляет идею из поискового индекса."""
+    remove_ideas([idea_id])
+
+
+def remove_ideas(idea_ids):
+    """Удаляет несколько идей из поискового индекса одним запросом."""
+    if not idea_ids:
+        return
+    if _backend() == 'fts5':
+        db.session.execute(
+            text(f"DELETE FROM {FTS_TABLE} WHERE rowid IN :ids").bindparams(bindparam('ids', expanding=True)),
+            {'ids': list(idea_ids)}
+        )
+    else:
+        SearchTerm.query.filter(SearchTerm.idea_id.in_(idea_ids)).delete(synchronize_session=False)
+
+
+# Поиск
+def _ranked_subquery(terms):
+    """Подзапрос (idea_id, rank): чем меньше rank, тем релевантнее идея."""
+    if _backend() == 'fts5':
+        # Каждый терм ищем как префикс, чтобы поиск работал по мере набора
+        match = ' '.join('"{}"*'.format(term.replace('"', '""')) for term in terms)
+        return text(
+            f"SELECT rowid AS idea_id, bm25({FTS_TABLE}, {FIELD_WEIGHTS['title']}, 1.0) AS rank "
+            f"FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match"
+        ).bindparams(match=match).columns(
+            idea_id=db.Integer, rank=db.Float
+        ).subquery('search_rank')
+
+    unique_terms = set(terms)
+    return db.session.query(
+        SearchTerm.idea_id.label('idea_id'),
+        (-func.sum(SearchTerm.weight)).label('rank')
+    ).filter(
+        SearchTerm.term.in_(unique_terms)
+    ).group_by(
+        SearchTerm.idea_id
+    ).having(
+        func.count(SearchTerm.term) == len(unique_terms)
+    ).subquery('search_rank')
+
+
+def apply_search(query, search_query):
+    """
+    Ограничивает запрос идеями, найденными по строке поиска.
+    Возвращает (запрос, колонка ранга) — колонку можно использовать для сортировки.
+    """
+    terms = tokenize(search_query)
+    if not terms:
+        return query, None
+
+    ranked = _ranked_subquery(terms)
+    query = query.join(ranked, ranked.c.idea_id == Idea.id)
+    return query, ranked.c.rank
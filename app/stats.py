@@ -0,0 +1,105 @@
+from collections import defaultdict
+
+from sqlalchemy import func
+
+from .extensions import db
+from .models import Idea, IdeaCounter
+
+
+# Форматы временных интервалов для разных СУБД
+PERIOD_FORMATS = {
+    'sqlite': {'week': '%Y-%W', 'month': '%Y-%m'},
+    'postgresql': {'week': 'IYYY-IW', 'month': 'YYYY-MM'},
+    'mysql': {'week': '%x-%v', 'month': '%Y-%m'},
+}
+
+
+def _period_expression(period):
+    """Возвращает SQL-выражение ключа интервала (неделя/месяц) для даты создания."""
+    dialect = db.engine.dialect.name
+    fmt = PERIOD_FORMATS.get(dialect, PERIOD_FORMATS['sqlite'])[period]
+    if dialect == 'postgresql':
+        return func.to_char(Idea.created_at, fmt)
+    if dialect == 'mysql':
+        return func.date_format(Idea.created_at, fmt)
+    return func.strftime(fmt, Idea.created_at)
+
+
+class IdeaStats:
+    """Агрегированная статистика идей: статус × категория × публикация (× период)."""
+
+    def __init__(self, rows, period=None):
+        self.period = period
+        self.total = 0
+        self.published = 0
+        self.by_status = defaultdict(int)
+        self.by_category = defaultdict(int)
+        self._cells = defaultdict(int)
+        self._series = defaultdict(int)
+
+        for row in rows:
+            count = row.count
+            is_published = bool(row.is_published)
+            self.total += count
+            if is_published:
+                self.published += count
+            self.by_status[row.status] += count
+            self.by_category[row.category_id] += count
+            self._cells[(row.status, row.category_id, is_published)] += count
+            if period:
+                self._series[(row.period, row.status, row.category_id, is_published)] += count
+
+    @property
+    def unpublished(self):
+        return self.total - self.published
+
+    def count(self, status=None, category_id=None, is_published=None):
+        """Количество идей с заданными статусом, категорией и признаком публикации."""
+        return sum(
+            count for (cell_status, cell_category, cell_published), count in self._cells.items()
+            if (status is None or cell_status == status)
+            and (category_id is None or cell_category == category_id)
+            and (is_published is None or cell_published == is_published)
+        )
+
+    def percent(self, status):
+        """Доля идей со статусом от общего числа, в процентах."""
+        if not self.total:
+            return 0
+        return round(self.by_status[status] / self.total * 100, 1)
+
+    def series(self, status=None, category_id=None, is_published=None):
+        """Временной ряд [(период, количество)], упорядоченный по периоду."""
+        buckets = defaultdict(int)
+        for (bucket, cell_status, cell_category, cell_published), count in self._series.items():
+            if (status is None or cell_status == status) \
+                    and (category_id is None or cell_category == category_id) \
+                    and (is_published is None or cell_published == is_published):
+                buckets[bucket] += count
+        return sorted(buckets.items())
+
+
+def collect_idea_stats(period=None):
+    """
+    Собирает статистику идей.
+    Без периода читает поддерживаемые счетчики (O(категорий)), с периодом
+    ('week' или 'month') считает одним запросом с GROUP BY по таблице идей.
+    """
+    if not period:
+        rows = db.session.query(
+            IdeaCounter.status, IdeaCounter.category_id, IdeaCounter.is_published, IdeaCounter.count
+        ).filter(IdeaCounter.count > 0).all()
+        return IdeaStats(rows)
+
+    return IdeaStats(period_stats_query(period).all(), period=period)
+
+
+def period_stats_query(period):
+    """Запрос статистики по интервалам: одна строка на период × статус × категорию × публикацию."""
+    columns = [
+        Idea.status, Idea.category_id, Idea.is_published,
+        _period_expression(period).label('period')
+    ]
+    return db.session.query(
+        *columns, func.count(Idea.id).label('count')
+    ).group_by(*columns)
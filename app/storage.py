@@ -0,0 +1,178 @@
+import os
+from urllib.parse import quote
+
+from flask import current_app
+
+
+class LocalStorage:
+    """
+    Файлы в локальной папке. Ключ - путь относительно корня хранилища
+    (для вложений - относительно корня приложения, как в Attachment.filepath).
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, key):
+        """Путь к файлу на диске."""
+        return os.path.join(self.root, key)
+
+    def exists(self, key):
+        return os.path.exists(self.path(key))
+
+    def store(self, key, source_path, content_type=None):
+        """Переносит готовый временный файл под ключ (атомарно)."""
+        target = self.path(key)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(source_path, target)
+
+    def touch(self, key):
+        """Обновляет время изменения файла (защита от сборщика мусора)."""
+        os.utime(self.path(key))
+
+    def open(self, key):
+        """Поток для чтения файла."""
+        return open(self.path(key), 'rb')
+
+    def size(self, key):
+        return os.path.getsize(self.path(key))
+
+    def mtime(self, key):
+        """Время изменения файла (unix time)."""
+        return os.path.getmtime(self.path(key))
+
+    def delete(self, key):
+        """Удаляет файл. Отсутствующий файл ошибкой не считается."""
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def list(self, prefix):
+        """Файлы с ключом, начинающимся с prefix: (ключ, размер, время изменения)."""
+        for directory, _, filenames in os.walk(self.path(prefix)):
+            for filename in filenames:
+                full_path = os.path.join(directory, filename)
+                try:
+                    stat = os.stat(full_path)
+                except FileNotFoundError:
+                    continue
+                yield os.path.relpath(full_path, self.root), stat.st_size, stat.st_mtime
+
+    def url(self, key, filename=None, content_type=None):
+        """Прямой ссылки нет - файл отдает приложение."""
+        return None
+
+
+class S3Storage:
+    """
+    Файлы в S3-совместимом хранилище (AWS S3, MinIO и т.п.).
+    Чтение и запись потоковые, скачивание - по временной подписанной ссылке.
+    """
+
+    def __init__(self, bucket, prefix='', endpoint_url=None, access_key=None, secret_key=None,
+                 region=None, presigned_expires=300):
+        try:
+            import boto3
+            from botocore.exceptions import ClientError
+        except ImportError:
+            raise RuntimeError('Для хранилища S3 нужен пакет boto3 (pip install boto3)')
+
+        self.bucket = bucket
+        self.prefix = prefix
+        self.presigned_expires = presigned_expires
+        self._client_error = ClientError
+        self.client = boto3.client(
+            's3',
+            endpoint_url=endpoint_url,
+            aws_access_key_id=access_key,
+            aws_secret_access_key=secret_key,
+            region_name=region
+        )
+
+    def _key(self, key):
+        return self.prefix + key.replace(os.sep, '/')
+
+    def exists(self, key):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+        except self._client_error as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+        return True
+
+    def store(self, key, source_path, content_type=None):
+        """Загружает временный файл (большие файлы - по частям) и удаляет его."""
+        extra = {'ContentType': content_type} if content_type else None
+        self.client.upload_file(source_path, self.bucket, self._key(key), ExtraArgs=extra)
+        os.remove(source_path)
+
+    def touch(self, key):
+        """
+        Обновляет время изменения объекта копированием в себя (без передачи данных).
+        Копирование в себя требует замены метаданных, поэтому текущие тип и метаданные передаются заново.
+        """
+        head = self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+        self.client.copy_object(
+            Bucket=self.bucket,
+            Key=self._key(key),
+            CopySource={'Bucket': self.bucket, 'Key': self._key(key)},
+            MetadataDirective='REPLACE',
+            ContentType=head.get('ContentType', 'binary/octet-stream'),
+            Metadata=head.get('Metadata', {})
+        )
+
+    def open(self, key):
+        """Поток для чтения объекта (данные читаются по мере обращения)."""
+        return self.client.get_object(Bucket=self.bucket, Key=self._key(key))['Body']
+
+    def size(self, key):
+        return self.client.head_object(Bucket=self.bucket, Key=self._key(key))['ContentLength']
+
+    def mtime(self, key):
+        return self.client.head_object(Bucket=self.bucket, Key=self._key(key))['LastModified'].timestamp()
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+    def list(self, prefix):
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self._key(prefix)):
+            for item in page.get('Contents', []):
+                key = item['Key'][len(self.prefix):].replace('/', os.sep)
+                yield key, item['Size'], item['LastModified'].timestamp()
+
+    def url(self, key, filename=None, content_type=None):
+        """Подписанная ссылка на скачивание (ETag и Range обрабатывает само хранилище)."""
+        params = {'Bucket': self.bucket, 'Key': self._key(key)}
+        if filename:
+            params['ResponseContentDisposition'] = f"attachment; filename*=UTF-8''{quote(filename)}"
+        if content_type:
+            params['ResponseContentType'] = content_type
+        return self.client.generate_presigned_url('get_object', Params=params, ExpiresIn=self.presigned_expires)
+
+
+def get_storage():
+    """Хранилище вложений по настройке ATTACHMENT_STORAGE (создается один раз на приложение)."""
+    storage = current_app.extensions.get('attachment_storage')
+    if storage:
+        return storage
+
+    config = current_app.config
+    if config['ATTACHMENT_STORAGE'] == 's3':
+        storage = S3Storage(
+            bucket=config['S3_BUCKET'],
+            prefix=config['S3_PREFIX'],
+            endpoint_url=config['S3_ENDPOINT_URL'],
+            access_key=config['S3_ACCESS_KEY'],
+            secret_key=config['S3_SECRET_KEY'],
+            region=config['S3_REGION'],
+            presigned_expires=config['S3_PRESIGNED_EXPIRES']
+        )
+    else:
+        storage = LocalStorage(current_app.root_path)
+
+    current_app.extensions['attachment_storage'] = storage
+    return storage
+
@@ -1,7 +1,7 @@
 import os
 from flask import session
-from .models import Moderator
-from .extensions import db
+from .blueprints.auth import get_current_moderator
+from .models import format_file_size
 
 
 def register_template_utils(app):
@@ -18,22 +18,11 @@ def register_template_utils(app):
     
     @app.context_processor
     def utility_processor():
-        def filesizeformat(value):
-            """Форматирует размер файла в удобочитаемый вид."""
-            if value == 0:
-                return "0 B"
-            for unit in ['B', 'KB', 'MB', 'GB']:
-                if value < 1024.0:
-                    return f"{value:.1f} {unit}"
-                value /= 1024.0
-            return f"{value:.1f} TB"
-        
-        return dict(filesizeformat=filesizeformat, os=os)
+        return dict(filesizeformat=format_file_size, os=os)
     
     @app.context_processor
     def inject_moderator():
         """Добавляет информацию о текущем модераторе в контекст шаблонов."""
         if 'moderator_id' in session:
-            moderator = db.session.get(Moderator, session['moderator_id'])
-            return {'current_moderator': moderator}
+            return {'current_moderator': get_current_moderator()}
         return {}
\ No newline at end of file
@@ -0,0 +1,76 @@
+import logging
+import threading
+
+from .extensions import db
+from .mail_queue import process_outbox
+from .notifications import send_moderator_digest
+from .previews import process_previews
+
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+# Фоновые потоки и их задачи. Превью строятся в своем потоке: отправка писем не ждет рендеринга
+BACKGROUND_WORKERS = {
+    'outbox-worker': [send_moderator_digest, process_outbox],
+    'preview-worker': [process_previews],
+}
+
+
+class BackgroundWorker(threading.Thread):
+    """
+    Фоновый поток, периодически выполняющий задачи: отправку очереди писем (process_outbox),
+    сборку дайджеста, построение превью. Медленные задачи выносятся в отдельный поток,
+    чтобы не задерживать отправку писем.
+    """
+
+    def __init__(self, app, tasks=(), name='background-worker'):
+        super().__init__(name=name, daemon=True)
+        self.app = app
+        self.tasks = list(tasks)
+        self.stop_event = threading.Event()
+
+    def run(self):
+        interval = self.app.config['MAIL_QUEUE_POLL_INTERVAL']
+        while not self.stop_event.is_set():
+            with self.app.app_context():
+                try:
+                    for task in self.tasks:
+                        task()
+                except Exception as e:
+                    db.session.rollback()
+                    logger.error(f"❌ Ошибка фоновой задачи ({self.name}): {e}")
+                finally:
+                    db.session.remove()
+            self.stop_event.wait(interval)
+
+    def stop(self):
+        self.stop_event.set()
+
+
+_worker_lock = threading.Lock()
+
+
+def start_worker(app, name, tasks=()):
+    """Запускает фоновый поток с задачами (один поток с таким именем на процесс)."""
+    with _worker_lock:
+        workers = app.extensions.setdefault('background_workers', {})
+        worker = workers.get(name)
+        if worker is None or not worker.is_alive():
+            worker = BackgroundWorker(app, tasks=tasks, name=name)
+            workers[name] = worker
+            worker.start()
+    return worker
+
+
+def init_workers(app, workers):
+    """
+    Запускает фоновые потоки {имя: задачи} при первом запросе, то есть только в процессе,
+    обслуживающем сайт: CLI-команды (миграции, обслуживание вложений, flask outbox worker)
+    потоки не запускают, а в run.py они стартуют уже после применения миграций.
+    """
+    @app.before_request
+    def _start_workers():
+        if 'background_workers' not in app.extensions:
+            for name, tasks in workers.items():
+                start_worker(app, name, tasks)
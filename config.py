@@ -19,6 +19,34 @@ class Config:
     # Загрузка файлов
     UPLOAD_FOLDER = 'uploads'
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB
+    UPLOAD_MAX_FILE_SIZE = int(os.environ.get('UPLOAD_MAX_FILE_SIZE', 10 * 1024 * 1024)) # Предел для одного файла, байт
+    PREVIEW_SIZE = 320 # Размер превью изображений и PDF, пикселей по большей стороне
+    PREVIEW_WORKERS = int(os.environ.get('PREVIEW_WORKERS', 2)) # Процессов для построения превью
+    ATTACHMENT_STORAGE = os.environ.get('ATTACHMENT_STORAGE', 'local') # Хранилище файлов: 'local' - папка загрузок, 's3' - S3-совместимое (нужен boto3)
+    ATTACHMENT_SENDFILE = os.environ.get('ATTACHMENT_SENDFILE', 'off') # Отдача файлов: 'off' - приложением, 'x-sendfile' - Apache/lighttpd, 'x-accel' - nginx
+    ATTACHMENT_ACCEL_PREFIX = os.environ.get('ATTACHMENT_ACCEL_PREFIX', '/protected-uploads/') # Внутренний location nginx для папки загрузок
+
+    # S3-совместимое хранилище (AWS S3, MinIO)
+    S3_BUCKET = os.environ.get('S3_BUCKET')
+    S3_PREFIX = os.environ.get('S3_PREFIX', '') # Префикс ключей объектов в бакете
+    S3_ENDPOINT_URL = os.environ.get('S3_ENDPOINT_URL') # Адрес сервера, если это не AWS (например, MinIO)
+    S3_ACCESS_KEY = os.environ.get('S3_ACCESS_KEY')
+    S3_SECRET_KEY = os.environ.get('S3_SECRET_KEY')
+    S3_REGION = os.environ.get('S3_REGION')
+    S3_PRESIGNED_EXPIRES = int(os.environ.get('S3_PRESIGNED_EXPIRES', 300)) # Срок действия ссылки на скачивание, секунд
+
+    # Пагинация: 'cursor' - по ключу сортировки (без OFFSET), 'offset' - по номерам страниц
+    PAGINATION_MODE = os.environ.get('PAGINATION_MODE', 'cursor')
+    PAGINATION_COUNT_TOTAL = os.environ.get('PAGINATION_COUNT_TOTAL', 'true').lower() == 'true' # Считать общее число идей (COUNT(*) на каждой странице)
+
+    # Кэш страниц для анонимных посетителей: 'memory' - LRU в процессе, 'redis' - общий (нужен пакет redis), 'off'
+    PAGE_CACHE_BACKEND = os.environ.get('PAGE_CACHE_BACKEND', 'memory')
+    PAGE_CACHE_MAX_ENTRIES = int(os.environ.get('PAGE_CACHE_MAX_ENTRIES', 1000)) # Сколько страниц хранить в памяти процесса
+    PAGE_CACHE_TTL = int(os.environ.get('PAGE_CACHE_TTL', 300)) # Время жизни страницы в кэше, секунд
+    PAGE_CACHE_REDIS_URL = os.environ.get('PAGE_CACHE_REDIS_URL', 'redis://localhost:6379/0')
+
+    # Поиск: 'auto' (FTS5 для SQLite), 'fts5' или 'index' (переносимый инвертированный индекс)
+    SEARCH_BACKEND = os.environ.get('SEARCH_BACKEND', 'auto')
 
     # Настройки почты
     SMTP_SERVER = os.environ.get('SMTP_SERVER')
@@ -26,6 +54,20 @@ class Config:
     FROM_EMAIL = os.environ.get('FROM_EMAIL')
     EMAIL_PASSWORD = os.environ.get('EMAIL_PASSWORD')
     MODERATOR_EMAIL = os.environ.get('MODERATOR_EMAIL')
+    SMTP_USE_TLS = os.environ.get('SMTP_USE_TLS', 'true').lower() == 'true' # STARTTLS перед авторизацией
+    SMTP_KEEPALIVE = 60 # Сколько секунд держать простаивающее SMTP-соединение открытым
+
+    # Очередь исходящих писем
+    MAIL_QUEUE_WORKER = os.environ.get('MAIL_QUEUE_WORKER', 'thread') # 'thread' - поток в приложении, 'off' - отдельный процесс (flask outbox worker)
+    MAIL_QUEUE_POLL_INTERVAL = 5 # Интервал опроса очереди, секунд
+    MAIL_QUEUE_MAX_ATTEMPTS = 6 # Максимум попыток отправки письма
+    MAIL_QUEUE_RETRY_BASE = 30 # Базовая задержка повтора, секунд (удваивается с каждой попыткой)
+    MAIL_QUEUE_RETRY_MAX = 3600 # Максимальная задержка повтора, секунд
+    MAIL_QUEUE_LEASE = 300 # На сколько секунд письмо резервируется обработчиком
+
+    # Уведомления модератору о новых идеях: 'immediate' - письмо на каждую идею, 'digest' - сводка
+    MODERATOR_NOTIFY_MODE = os.environ.get('MODERATOR_NOTIFY_MODE', 'immediate')
+    MODERATOR_DIGEST_INTERVAL = int(os.environ.get('MODERATOR_DIGEST_INTERVAL', 15 * 60)) # Окно сбора дайджеста, секунд
 
     # Пароли модераторов (для инициализации)
     MODERATOR_VLASUK_PWD = os.environ.get('MODERATOR_VLASUK_PWD')